@@ -0,0 +1,164 @@
+import bisect
+import math
+
+from prometheus_client import Gauge
+
+MAX_SEQUENCE_LENGTH = 512  # Truncation length of the worker's tokenizer
+
+batch_wait_gauge = Gauge('coordinator_batch_wait_seconds', 'Current batch wait window chosen by the batch wait controller', multiprocess_mode='livemax')
+arrival_rate_gauge = Gauge('coordinator_arrival_rate_tokens', 'Estimated arrival rate of texts in tokens per second', multiprocess_mode='livesum')
+worker_latency_gauge = Gauge('coordinator_worker_latency_seconds', 'Worker batch latency used by the batch wait controller', multiprocess_mode='livemax')
+dispatch_utilization_gauge = Gauge('coordinator_dispatch_utilization', 'Fraction of worker credits in use', multiprocess_mode='livemax')
+
+
+def estimate_tokens(text):
+    '''
+    Cheap estimate of the tokenized length of a text, including the [CLS] and [SEP] tokens.
+    WordPiece averages roughly five characters of English text per token.
+    '''
+    return min(MAX_SEQUENCE_LENGTH, len(text) // 5 + 2)
+
+
+class PendingBatch:
+    '''
+    Texts waiting to be dispatched to a worker together.
+    '''
+
+    def __init__(self, started):
+        self.started = started
+        self.texts = []
+        self.ids = []
+        self.futures = []
+        self.max_tokens = 0
+        self.expires_at = math.inf  # Earliest client deadline of the texts
+
+    def add(self, text, id, future, tokens, expires_at=math.inf):
+        self.texts.append(text)
+        self.ids.append(id)
+        self.futures.append(future)
+        self.max_tokens = max(self.max_tokens, tokens)
+        self.expires_at = min(self.expires_at, expires_at)
+
+    @property
+    def padded_tokens(self):
+        '''
+        Estimated size of the padded model input, which is what the worker's compute cost scales with.
+        '''
+        return len(self.texts) * self.max_tokens
+
+    def fits(self, tokens, token_budget, max_texts):
+        return (len(self.texts) < max_texts
+                and (len(self.texts) + 1) * max(self.max_tokens, tokens) <= token_budget)
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class LengthBuckets:
+    '''
+    Pending batches bucketed by estimated sequence length.
+
+    Workers pad a batch to its longest text, so a single long text makes every short text in the
+    batch as expensive as itself. Texts of similar length are collected in the same bucket, and each
+    bucket is dispatched when it is full or its wait time has expired.
+
+    A batch is full when it reaches the padded token budget (texts x longest text), so batches of short
+    texts hold many more texts than batches of long ones, and take roughly the same time on a worker.
+    Buckets that are not full are dispatched max_wait seconds after their first text arrived, max_wait
+    may be changed at any time and applies to the pending buckets as well. A bucket holding a text whose
+    client deadline is less than dispatch_margin seconds away is dispatched right away.
+    '''
+
+    def __init__(self, boundaries, token_budget, max_batch_texts, max_wait):
+        self.boundaries = sorted(boundaries)
+        self.token_budget = token_budget
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait
+        self.dispatch_margin = 0
+        self._batches = [None] * (len(self.boundaries) + 1)
+
+    def add(self, text, id, future, now, expires_at=math.inf):
+        '''
+        Add a text to its bucket. Returns the batches that are full and ready for dispatch.
+        '''
+        ready = []
+        tokens = estimate_tokens(text)
+        idx = bisect.bisect_left(self.boundaries, tokens)
+        batch = self._batches[idx]
+        if batch is not None and not batch.fits(tokens, self.token_budget, self.max_batch_texts):
+            ready.append(batch)
+            batch = None
+        if batch is None:
+            batch = PendingBatch(now)
+        batch.add(text, id, future, tokens, expires_at)
+        if batch.padded_tokens >= self.token_budget or len(batch) >= self.max_batch_texts:
+            ready.append(batch)
+            batch = None
+        self._batches[idx] = batch
+        return ready
+
+    def next_deadline(self):
+        '''
+        Time at which the next bucket is due, or None if no texts are pending.
+        '''
+        deadlines = [self._deadline(batch) for batch in self._batches if batch is not None]
+        return min(deadlines, default=None)
+
+    def pop_due(self, now):
+        '''
+        Remove and return all batches whose wait time has expired.
+        '''
+        due = []
+        for idx, batch in enumerate(self._batches):
+            if batch is not None and self._deadline(batch) <= now:
+                self._batches[idx] = None
+                due.append(batch)
+        return due
+
+    def _deadline(self, batch):
+        return min(batch.started + self.max_wait, batch.expires_at - self.dispatch_margin)
+
+
+class BatchWaitController:
+    '''
+    Chooses how long pending buckets wait for more texts before they are dispatched.
+
+    Waiting only pays off when the workers are busy: an idle worker could process a small batch right
+    away, while on a saturated system fuller batches raise throughput. The window therefore scales
+    with the utilization of the inflight batch slots, so batches are flushed immediately at low load.
+    It is capped by
+    - the time the current arrival rate needs to fill a batch, waiting longer does not fill it further,
+    - half of the latency SLO left after the worker's batch latency, the rest is kept for queueing,
+    - max_wait.
+    '''
+
+    def __init__(self, max_wait, latency_slo, rate_window=1.0):
+        self.max_wait = max_wait
+        self.latency_slo = latency_slo
+        self.rate_window = rate_window
+        self._rate = 0.0  # tokens per second, exponentially decayed
+        self._last_arrival = None
+
+    def observe_arrival(self, tokens, now):
+        self._rate = self.arrival_rate(now) + tokens / self.rate_window
+        self._last_arrival = now
+
+    def arrival_rate(self, now):
+        if self._last_arrival is None:
+            return 0.0
+        return self._rate * math.exp(-(now - self._last_arrival) / self.rate_window)
+
+    def window(self, now, token_budget, worker_latency, utilization):
+        '''
+        Compute the wait window from the current arrival rate, worker batch latency (seconds) and
+        inflight slot utilization, and export the decision.
+        '''
+        rate = self.arrival_rate(now)
+        fill_time = token_budget / rate if rate > 0 else math.inf
+        slack = max(0.0, self.latency_slo - worker_latency)
+        window = min(self.max_wait, fill_time, slack / 2) * min(1.0, utilization)
+        batch_wait_gauge.set(window)
+        arrival_rate_gauge.set(rate)
+        worker_latency_gauge.set(worker_latency)
+        dispatch_utilization_gauge.set(utilization)
+        return window
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from grpc.experimental import aio
+
+from proto.private_pb2 import InferRequest
+from proto.private_pb2_grpc import WorkerStub
+
+# Keepalive pings detect dead connections between calls, reconnect backoff is kept short so a
+# restarted worker is picked up again quickly. The worker server must permit these pings.
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),
+    ("grpc.keepalive_timeout_ms", 5000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.initial_reconnect_backoff_ms", 500),
+    ("grpc.max_reconnect_backoff_ms", 5000),
+]
+
+
+class WorkerChannelPool:
+    '''
+    Pool of long-lived gRPC channels and stubs, keyed by worker IP.
+
+    Channels are reused across batches and heartbeats, so the TCP and HTTP/2 setup is only paid
+    once per worker. The pool is kept in sync with the resolved worker list: new workers are
+    connected eagerly, channels of removed workers are closed.
+    '''
+
+    def __init__(self, port, options=CHANNEL_OPTIONS, connect_timeout=2, stream_max_outstanding=8):
+        self._port = port
+        self._options = options
+        self._connect_timeout = connect_timeout
+        self._stream_max_outstanding = stream_max_outstanding
+        self._channels = {}
+        self._stubs = {}
+        self._streams = {}
+
+    def get_stub(self, worker_ip):
+        '''
+        Return the stub for a worker, opening a channel if the worker is not pooled yet.
+        '''
+        stub = self._stubs.get(worker_ip)
+        if stub is None:
+            stub = self._open(worker_ip)
+        return stub
+
+    def get_stream(self, worker_ip):
+        '''
+        Return the InferStream session for a worker, creating it if needed.
+        '''
+        stream = self._streams.get(worker_ip)
+        if stream is None:
+            stream = self._streams[worker_ip] = InferStream(self.get_stub(worker_ip), self._stream_max_outstanding)
+        return stream
+
+    async def sync(self, worker_ips):
+        '''
+        Open and connect channels for newly discovered workers and close channels of removed ones.
+        '''
+        added = [ip for ip in worker_ips if ip not in self._channels]
+        removed = [ip for ip in self._channels if ip not in worker_ips]
+        for worker_ip in removed:
+            await self._close(worker_ip)
+        for worker_ip in added:
+            self._open(worker_ip)
+        await asyncio.gather(*(self._connect(ip) for ip in added))
+
+    async def close(self):
+        for worker_ip in list(self._channels):
+            await self._close(worker_ip)
+
+    def _open(self, worker_ip):
+        channel = aio.insecure_channel(f"{worker_ip}:{self._port}", options=self._options)
+        self._channels[worker_ip] = channel
+        self._stubs[worker_ip] = WorkerStub(channel)
+        logging.info(f"Opened channel to worker {worker_ip}:{self._port}")
+        return self._stubs[worker_ip]
+
+    async def _connect(self, worker_ip):
+        channel = self._channels.get(worker_ip)
+        if channel is None:
+            return
+        try:
+            await asyncio.wait_for(channel.channel_ready(), timeout=self._connect_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Worker {worker_ip}:{self._port} not ready after {self._connect_timeout}s, "
+                            f"channel keeps reconnecting in the background.")
+
+    async def _close(self, worker_ip):
+        channel = self._channels.pop(worker_ip, None)
+        self._stubs.pop(worker_ip, None)
+        stream = self._streams.pop(worker_ip, None)
+        if stream is not None:
+            stream.close()
+        if channel is not None:
+            await channel.close()
+            logging.info(f"Closed channel to removed worker {worker_ip}:{self._port}")
+
+
+class WorkerStreamError(Exception):
+    '''
+    Raised for a batch whose stream broke or that the worker answered with an error.
+    '''
+
+
+class InferStream:
+    '''
+    Long-lived bidirectional InferStream call to one worker.
+
+    Batches are tagged with a batch id and written to the stream, the worker streams the results back
+    as they complete, in any order, and they are matched to the waiting callers by their batch id.
+    At most max_outstanding batches are in flight on the stream, further callers wait for a free slot.
+    The call is (re)opened on demand, a broken call fails all of its outstanding batches. A call that
+    has not answered anything for stall_timeout seconds after a batch was sent is considered stuck.
+    '''
+
+    def __init__(self, stub, max_outstanding, stall_timeout=2):
+        self._stub = stub
+        self._stall_timeout = stall_timeout
+        self._slots = asyncio.Semaphore(max_outstanding)
+        self._write_lock = asyncio.Lock()
+        self._call = None
+        self._pending = {}  # batch_id -> future, for the current call
+        self._last_response = {}  # call -> time of its last response
+        self._reader = None
+
+    async def infer(self, request, timeout):
+        '''
+        Send a batch on the stream and wait for its response. Like a unary Infer call, a response with an
+        error code is returned, failures of the stream itself raise. timeout covers waiting for a slot,
+        writing the batch (which blocks while the worker does not read, see HTTP/2 flow control) and the response.
+        '''
+        deadline = time.monotonic() + timeout
+        await asyncio.wait_for(self._slots.acquire(), timeout=timeout)
+        try:
+            self._ensure_open()
+            call, pending = self._call, self._pending
+            batch_request = InferRequest()
+            batch_request.CopyFrom(request)
+            batch_request.batch_id = uuid.uuid4().hex
+            fut = asyncio.get_event_loop().create_future()
+            pending[batch_request.batch_id] = fut
+            writing, sent = time.monotonic(), None
+            # A timed out write is left to finish in the background instead of being cancelled halfway, its
+            # late response is ignored. Writes that stay blocked end with the stream reset below.
+            write = asyncio.ensure_future(self._write(call, batch_request, pending))
+            write.add_done_callback(lambda task: task.cancelled() or task.exception())
+            try:
+                await asyncio.wait_for(asyncio.shield(write), timeout=deadline - writing)
+                sent = time.monotonic()
+                response = await asyncio.wait_for(fut, timeout=deadline - sent)
+            except asyncio.TimeoutError:
+                # The write was blocked, or nothing came back since this batch was sent, for stall_timeout:
+                # the stream is likely stuck. Reset it, so the other outstanding batches fail fast and later
+                # batches get a fresh call. Batches with a short client deadline may time out on a healthy
+                # stream, they do not count.
+                now = time.monotonic()
+                if sent is None:
+                    stuck = now - writing >= self._stall_timeout
+                else:
+                    stuck = self._last_response.get(call, 0) < sent and now - sent >= self._stall_timeout
+                if stuck:
+                    logging.warning("InferStream made no progress within the batch timeout, resetting the stream.")
+                    call.cancel()
+                raise
+            finally:
+                pending.pop(batch_request.batch_id, None)
+        finally:
+            self._slots.release()
+        return response
+
+    async def _write(self, call, request, pending):
+        async with self._write_lock:
+            if request.batch_id in pending:  # Not given up while waiting for the lock
+                await call.write(request)
+
+    def close(self):
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+
+    def _ensure_open(self):
+        if self._call is None or self._call.done():
+            self._call = self._stub.InferStream()
+            self._pending = {}
+            self._reader = asyncio.create_task(self._read(self._call, self._pending))
+
+    async def _read(self, call, pending):
+        error = WorkerStreamError("Stream closed by worker.")
+        try:
+            async for response in call:
+                self._last_response[call] = time.monotonic()
+                fut = pending.get(response.batch_id)
+                if fut is not None and not fut.done():
+                    fut.set_result(response)
+        except asyncio.CancelledError:
+            error = WorkerStreamError("Stream cancelled.")
+        except Exception as e:
+            error = WorkerStreamError(f"Stream failed: {e}")
+        finally:
+            if self._call is call:
+                self._call = None
+            self._last_response.pop(call, None)
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(error)
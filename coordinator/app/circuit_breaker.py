@@ -0,0 +1,159 @@
+import logging
+import statistics
+import time
+from collections import deque
+
+from prometheus_client import Counter, Gauge
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+breaker_state_gauge = Gauge('coordinator_worker_breaker_state', 'Circuit breaker state per worker (0 closed, 1 half open, 2 open)', ['worker'], multiprocess_mode='livemax')
+ejection_count = Counter('coordinator_worker_ejection_count', 'Number of times a worker was ejected from dispatch', ['worker', 'reason'])
+
+
+class Breaker:
+    '''
+    Dispatch outcomes of one worker and the state of its circuit breaker.
+    '''
+
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = deque()  # (time, ok) of the calls in the error rate window
+        self.consecutive_failures = 0
+        self.latency_ewma = None  # ms
+        self.samples = 0  # Completed calls since the breaker closed
+        self.ejections = 0  # Consecutive ejections, doubles the ejection time
+        self.open_until = 0.0
+        self.closed_at = 0.0
+        self.probing = False  # A probe call of the half open breaker is in flight
+
+
+class CircuitBreakers:
+    '''
+    Per-worker circuit breakers fed by the outcomes of real dispatches, so a worker that answers
+    heartbeats but fails or crawls on Infer is taken out of rotation on its next calls.
+
+    A breaker opens (the worker is ejected) after consecutive_failures failed calls in a row, when at
+    least error_rate of the calls in the last window seconds failed (with at least min_requests calls),
+    or when the latency EWMA of the worker exceeds latency_factor times the median of the other workers.
+    An ejected worker gets no batches for base_ejection seconds, doubled with every consecutive
+    ejection up to max_ejection. Then the breaker is half open and lets a single probe batch through:
+    if it succeeds in time, the worker is re-admitted, otherwise it is ejected again. At most
+    max_ejected_ratio of the workers are ejected at a time, so a fleet-wide problem does not eject all.
+    '''
+
+    def __init__(self, consecutive_failures=5, error_rate=0.5, min_requests=10, window=10,
+                 latency_factor=5.0, base_ejection=1.0, max_ejection=30.0, max_ejected_ratio=0.5, alpha=0.3):
+        self.consecutive_failures = consecutive_failures
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.latency_factor = latency_factor
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        self.max_ejected_ratio = max_ejected_ratio
+        self.alpha = alpha
+        self._breakers = {}
+
+    def get(self, worker_ip):
+        breaker = self._breakers.get(worker_ip)
+        if breaker is None:
+            breaker = self._breakers[worker_ip] = Breaker()
+            breaker_state_gauge.labels(worker_ip).set(CLOSED)
+        return breaker
+
+    def allows(self, worker_ip):
+        '''
+        True if the worker may get a batch: its breaker is closed, or it is due for a probe.
+        '''
+        breaker = self.get(worker_ip)
+        if breaker.state == OPEN and time.monotonic() >= breaker.open_until:
+            self._set_state(worker_ip, breaker, HALF_OPEN)
+        if breaker.state == HALF_OPEN:
+            return not breaker.probing
+        return breaker.state == CLOSED
+
+    def dispatched(self, worker_ip):
+        '''
+        Record that a batch was assigned to the worker, the probe if its breaker is half open.
+        '''
+        breaker = self.get(worker_ip)
+        if breaker.state == HALF_OPEN:
+            breaker.probing = True
+
+    def record(self, worker_ip, ok, latency=None):
+        '''
+        Record the outcome of a call: ok True or False, or None if it was abandoned (cancelled or never
+        sent), which only ends a probe. latency in ms of completed calls.
+        '''
+        breaker = self.get(worker_ip)
+        was_probe, breaker.probing = breaker.probing, False
+        if ok is None:
+            return
+        now = time.monotonic()
+        if ok and latency is not None:
+            if breaker.latency_ewma is None or was_probe:
+                breaker.latency_ewma = latency
+            else:
+                breaker.latency_ewma += self.alpha * (latency - breaker.latency_ewma)
+            breaker.samples += 1
+        if breaker.state != CLOSED:
+            if was_probe and ok and not self._latency_outlier(worker_ip, breaker):
+                self._close(worker_ip, breaker, now)
+            elif was_probe:
+                self._open(worker_ip, breaker, now, "probe", force=True)
+            return
+        breaker.outcomes.append((now, ok))
+        while breaker.outcomes and breaker.outcomes[0][0] < now - self.window:
+            breaker.outcomes.popleft()
+        breaker.consecutive_failures = 0 if ok else breaker.consecutive_failures + 1
+        failures = sum(1 for _, call_ok in breaker.outcomes if not call_ok)
+        if breaker.consecutive_failures >= self.consecutive_failures:
+            self._open(worker_ip, breaker, now, "consecutive_failures")
+        elif len(breaker.outcomes) >= self.min_requests and failures >= self.error_rate * len(breaker.outcomes):
+            self._open(worker_ip, breaker, now, "error_rate")
+        elif breaker.samples >= self.min_requests and self._latency_outlier(worker_ip, breaker):
+            self._open(worker_ip, breaker, now, "latency")
+
+    def _latency_outlier(self, worker_ip, breaker):
+        others = [other.latency_ewma for ip, other in self._breakers.items()
+                  if ip != worker_ip and other.state == CLOSED and other.latency_ewma is not None]
+        if not others or breaker.latency_ewma is None:
+            return False
+        return breaker.latency_ewma > self.latency_factor * statistics.median(others)
+
+    def _open(self, worker_ip, breaker, now, reason, force=False):
+        # Re-ejecting a worker that is already out does not change how many are ejected
+        ejected = sum(1 for other in self._breakers.values() if other.state != CLOSED)
+        if not force and ejected + 1 > self.max_ejected_ratio * len(self._breakers):
+            return
+        if breaker.state == CLOSED and now - breaker.closed_at > self.max_ejection:
+            breaker.ejections = 0  # Stayed healthy for a while, start over with the base ejection time
+        breaker.ejections += 1
+        ejection_time = min(self.max_ejection, self.base_ejection * 2 ** (breaker.ejections - 1))
+        breaker.open_until = now + ejection_time
+        ejection_count.labels(worker_ip, reason).inc()
+        logging.warning(f"Ejected worker {worker_ip} for {ejection_time:.1f}s: reason={reason} "
+                        f"latency_ewma={breaker.latency_ewma or 0:.1f}ms consecutive_failures={breaker.consecutive_failures}")
+        self._set_state(worker_ip, breaker, OPEN)
+
+    def _close(self, worker_ip, breaker, now):
+        breaker.outcomes.clear()
+        breaker.consecutive_failures = 0
+        breaker.samples = 0
+        breaker.closed_at = now
+        logging.info(f"Re-admitted worker {worker_ip} after a successful probe.")
+        self._set_state(worker_ip, breaker, CLOSED)
+
+    def _set_state(self, worker_ip, breaker, state):
+        breaker.state = state
+        breaker_state_gauge.labels(worker_ip).set(state)
+
+    def forget(self, worker_ips):
+        '''
+        Drop the state of all workers not in worker_ips.
+        '''
+        for worker_ip in list(self._breakers):
+            if worker_ip not in worker_ips:
+                del self._breakers[worker_ip]
+                breaker_state_gauge.remove(worker_ip)
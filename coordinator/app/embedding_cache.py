@@ -0,0 +1,84 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+# Rough per-entry bookkeeping cost (key digest, tuple, dict slot) on top of the embedding row
+ENTRY_OVERHEAD_BYTES = 200
+
+cache_hit_count = Counter('coordinator_cache_hit_count', 'Number of texts served from the embedding cache')
+cache_miss_count = Counter('coordinator_cache_miss_count', 'Number of texts not found in the embedding cache')
+cache_eviction_count = Counter('coordinator_cache_eviction_count', 'Number of entries evicted from the embedding cache',
+                               ['reason'])
+cache_size_gauge = Gauge('coordinator_cache_size_bytes', 'Estimated memory used by the embedding cache', multiprocess_mode='livesum')
+cache_entries_gauge = Gauge('coordinator_cache_entries', 'Number of entries in the embedding cache', multiprocess_mode='livesum')
+
+
+class EmbeddingCache:
+    '''
+    LRU cache of embedding rows keyed by text and model identity, bounded by memory and entry age.
+
+    Entries are only valid for the model that produced them. Workers report their model identity
+    with every response, and lookups only return rows of the models the workers currently serve, so
+    a mixed fleet (e.g. during a rollout) keeps the rows of every model it serves. Rows of models that
+    are no longer served are not returned and age out of the cache.
+    '''
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (row, expires_at, model_id)
+        self._bytes = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, text, model_ids):
+        '''
+        Return the cached embedding row for a text computed by any of model_ids, or None on a miss.
+        '''
+        if not self.enabled:
+            return None
+        for model_id in model_ids:
+            key = self._key(text, model_id)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._remove(key, "expired")
+                self._update_gauges()
+                entry = None
+            if entry is not None and entry[2] == model_id:
+                self._entries.move_to_end(key)
+                cache_hit_count.inc()
+                return entry[0]
+        cache_miss_count.inc()
+        return None
+
+    def put(self, text, row, model_id):
+        '''
+        Store an embedding row computed by a worker running model_id.
+        '''
+        if not self.enabled:
+            return
+        key = self._key(text, model_id)
+        if key in self._entries:
+            self._remove(key, None)
+        self._entries[key] = (row, time.monotonic() + self.ttl, model_id)
+        self._bytes += len(row) + ENTRY_OVERHEAD_BYTES
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)), "memory")
+        self._update_gauges()
+
+    def _key(self, text, model_id):
+        return hashlib.blake2b(f"{model_id}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def _remove(self, key, reason):
+        row, _, _ = self._entries.pop(key)
+        self._bytes -= len(row) + ENTRY_OVERHEAD_BYTES
+        if reason:
+            cache_eviction_count.labels(reason).inc()
+
+    def _update_gauges(self):
+        cache_size_gauge.set(self._bytes)
+        cache_entries_gauge.set(len(self._entries))
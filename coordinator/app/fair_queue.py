@@ -0,0 +1,101 @@
+import asyncio
+import time
+from collections import deque
+
+from prometheus_client import Gauge, Histogram
+
+queue_depth_gauge = Gauge('coordinator_class_queue_size', 'Number of requests queued per priority class', ['priority'], multiprocess_mode='livesum')
+queue_wait_histogram = Histogram('coordinator_class_queue_wait_seconds', 'Time requests spent in the queue per priority class',
+                                 ['priority'], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+
+class FairQueue:
+    '''
+    Request queue with one FIFO per priority class, served by weighted fair queuing.
+
+    Every entry gets a virtual finish time of its class' previous finish time (or the current virtual
+    time, if the class was idle) plus its cost divided by the class weight, and entries are served in
+    order of their finish time. Under load, each class gets a share of the texts proportional to its
+    weight, so a bulk backfill cannot starve online queries, while an idle class' share goes to the others.
+
+    Each class holds at most max_size entries, and each named tenant at most tenant_limit entries.
+    '''
+
+    def __init__(self, weights, max_size, tenant_limit):
+        self.weights = dict(weights)  # class name -> weight
+        self.max_size = max_size
+        self.tenant_limit = tenant_limit
+        self._queues = {cls: deque() for cls in self.weights}
+        self._last_finish = {cls: 0.0 for cls in self.weights}
+        self._virtual_time = 0.0
+        self._tenant_sizes = {}
+        self._waiters = []  # futures of producers and consumers waiting for the queue to change
+
+    def full(self, cls, tenant="", count=1):
+        '''
+        True if there is no room for count more entries of the class and tenant.
+        '''
+        return (len(self._queues[cls]) + count > self.max_size
+                or (bool(tenant) and self._tenant_sizes.get(tenant, 0) + count > self.tenant_limit))
+
+    def qsize(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def empty(self):
+        return self.qsize() == 0
+
+    async def put(self, item, cls, tenant="", cost=1):
+        '''
+        Queue an item of the given cost, waiting while the class queue or the tenant is full.
+        '''
+        while self.full(cls, tenant):
+            await self._wait()
+        self.put_nowait(item, cls, tenant, cost)
+
+    def put_nowait(self, item, cls, tenant="", cost=1):
+        '''
+        Queue an item of the given cost, raises asyncio.QueueFull if the class queue or the tenant is full.
+        '''
+        if self.full(cls, tenant):
+            raise asyncio.QueueFull()
+        finish = max(self._virtual_time, self._last_finish[cls]) + cost / self.weights[cls]
+        self._last_finish[cls] = finish
+        self._queues[cls].append((finish, time.monotonic(), tenant, item))
+        if tenant:
+            self._tenant_sizes[tenant] = self._tenant_sizes.get(tenant, 0) + 1
+        queue_depth_gauge.labels(cls).set(len(self._queues[cls]))
+        self._wake()
+
+    async def get(self):
+        while self.empty():
+            await self._wait()
+        return self.get_nowait()
+
+    def get_nowait(self):
+        '''
+        Remove and return the item with the earliest virtual finish time.
+        '''
+        if self.empty():
+            raise asyncio.QueueEmpty()
+        cls = min((queue[0][0], cls) for cls, queue in self._queues.items() if queue)[1]
+        finish, queued_at, tenant, item = self._queues[cls].popleft()
+        self._virtual_time = finish
+        if tenant:
+            self._tenant_sizes[tenant] -= 1
+            if not self._tenant_sizes[tenant]:
+                del self._tenant_sizes[tenant]
+        queue_depth_gauge.labels(cls).set(len(self._queues[cls]))
+        queue_wait_histogram.labels(cls).observe(time.monotonic() - queued_at)
+        self._wake()
+        return item
+
+    async def _wait(self):
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        await fut
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
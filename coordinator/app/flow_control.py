@@ -0,0 +1,164 @@
+import asyncio
+
+from prometheus_client import Gauge
+
+worker_inflight_gauge = Gauge('coordinator_worker_inflight_batches', 'Number of batches in flight per worker', ['worker'], multiprocess_mode='livesum')
+worker_window_gauge = Gauge('coordinator_worker_credit_window', 'Credit window (max batches in flight) per worker', ['worker'], multiprocess_mode='livesum')
+
+
+class CreditWindow:
+    '''
+    Flow control state of one worker: the batches it may have in flight, the batches it has in flight,
+    a short-term moving average of its latency relative to the expected latency, and the long-term
+    moving averages the expected latency of a batch is fitted from.
+    '''
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.inflight = 0
+        self.slowdown = None  # Latency / expected latency, None until the first batch completed
+        self.moments = None  # Means of tokens, latency (ms), tokens², tokens * latency
+        self.completed = 0  # Batches completed since the last decrease
+
+    @property
+    def credits(self):
+        return max(0, int(self.limit) - self.inflight)
+
+
+def expected_latency(moments, tokens):
+    '''
+    Latency (ms) of a batch of tokens padded tokens by a least-squares fit of overhead + cost * tokens
+    to the moments (mean tokens, latency, tokens², tokens * latency) of the past batches.
+    While the batch sizes barely vary, the overhead and cost cannot be told apart, and larger batches are
+    expected to take proportionally longer and smaller ones as long as the past batches.
+    '''
+    mean_tokens, mean_latency, mean_tokens_sq, mean_product = moments
+    variance = mean_tokens_sq - mean_tokens ** 2
+    if variance <= (0.1 * mean_tokens) ** 2:
+        return max(mean_latency, mean_latency * tokens / mean_tokens)
+    cost = min(mean_latency / mean_tokens, max(0.0, (mean_product - mean_tokens * mean_latency) / variance))
+    overhead = mean_latency - cost * mean_tokens
+    return max(1e-3, overhead + cost * tokens)
+
+
+class WorkerCredits:
+    '''
+    Per-worker credit windows, sized AIMD-style from the measured latency of each worker.
+
+    A batch is only dispatched to a worker with a free credit, so a slow worker cannot hold the
+    capacity of the others. Batch latencies are compared to the latency expected for the batch size,
+    from a long-term fit of latency = overhead + cost * padded tokens per worker, so larger batches are
+    not mistaken for queueing. While the recent latency of a worker stays within latency_tolerance
+    times the expected latency, every completed batch grows its window by 1/window, i.e. by one credit
+    per window of completed batches, as long as the window was in use. A higher recent latency means
+    batches queue on the worker, and failed calls mean it is overloaded or gone, both multiply the
+    window by backoff, at most once per window of completed batches, so a burst of slow batches
+    counts as one congestion event.
+    '''
+
+    def __init__(self, initial, min_window, max_window, latency_tolerance=2.0, backoff=0.5,
+                 alpha=0.2, base_alpha=0.01):
+        self.initial = initial
+        self.min_window = min_window
+        self.max_window = max_window
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.alpha = alpha
+        self.base_alpha = base_alpha
+        self._windows = {}
+        self._waiters = []  # futures of dispatchers waiting for a credit
+
+    def get(self, worker_ip):
+        window = self._windows.get(worker_ip)
+        if window is None:
+            window = self._windows[worker_ip] = CreditWindow(self.initial)
+            worker_inflight_gauge.labels(worker_ip).set(0)
+            worker_window_gauge.labels(worker_ip).set(int(window.limit))
+        return window
+
+    def available(self, worker_ip):
+        return self.get(worker_ip).credits > 0
+
+    def acquire(self, worker_ip):
+        window = self.get(worker_ip)
+        window.inflight += 1
+        worker_inflight_gauge.labels(worker_ip).set(window.inflight)
+
+    def release(self, worker_ip, latency=None, failed=False, tokens=1):
+        '''
+        Return the credit of a finished call. latency (ms) of a completed call of tokens padded tokens,
+        or failed, adjust the window. Calls that were abandoned, e.g. hedging losers, only return their credit.
+        '''
+        window = self.get(worker_ip)
+        window_full = window.credits == 0
+        window.inflight = max(0, window.inflight - 1)
+        window.completed += 1
+        if failed:
+            self._decrease(window)
+        elif latency is not None:
+            slowdown = self._observe(window, latency, max(1, tokens))
+            if window.slowdown is None:
+                window.slowdown = slowdown
+            else:
+                window.slowdown += self.alpha * (slowdown - window.slowdown)
+            if window.slowdown > self.latency_tolerance:
+                self._decrease(window)
+            elif window_full:
+                window.limit = min(self.max_window, window.limit + 1 / window.limit)
+        worker_inflight_gauge.labels(worker_ip).set(window.inflight)
+        worker_window_gauge.labels(worker_ip).set(int(window.limit))
+        self._wake()
+
+    def _observe(self, window, latency, tokens):
+        '''
+        Return the latency of a batch relative to the latency expected for its padded tokens, and add it
+        to the long-term fit of the window.
+        '''
+        sample = (tokens, latency, tokens * tokens, tokens * latency)
+        if window.moments is None:
+            window.moments = sample
+            return 1.0
+        slowdown = latency / expected_latency(window.moments, tokens)
+        window.moments = tuple(mean + self.base_alpha * (value - mean) for mean, value in zip(window.moments, sample))
+        return slowdown
+
+    def _decrease(self, window):
+        if window.completed < int(window.limit):
+            return
+        window.limit = max(self.min_window, window.limit * self.backoff)
+        window.completed = 0
+
+    def utilization(self, worker_ips):
+        '''
+        Fraction of the credits of the given workers in use, 1 if there are none.
+        '''
+        windows = [self.get(ip) for ip in worker_ips]
+        limit = sum(int(window.limit) for window in windows)
+        return sum(window.inflight for window in windows) / limit if limit else 1.0
+
+    async def wait(self, timeout):
+        '''
+        Wait until a credit is returned, at most timeout seconds.
+        '''
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    def forget(self, worker_ips):
+        '''
+        Drop the state of all workers not in worker_ips.
+        '''
+        for worker_ip in list(self._windows):
+            if worker_ip not in worker_ips:
+                del self._windows[worker_ip]
+                worker_inflight_gauge.remove(worker_ip)
+                worker_window_gauge.remove(worker_ip)
@@ -0,0 +1,56 @@
+from collections import deque
+
+from prometheus_client import Counter, Gauge
+
+hedge_count = Counter('coordinator_hedge_count', 'Number of hedged duplicate batches sent to a second worker')
+hedge_win_count = Counter('coordinator_hedge_win_count', 'Number of hedged batches answered first by the second worker')
+hedge_budget_exhausted_count = Counter('coordinator_hedge_budget_exhausted_count',
+                                       'Number of batches not hedged because the hedge budget was used up')
+hedge_threshold_gauge = Gauge('coordinator_hedge_threshold_seconds', 'Batch latency after which a batch is hedged', multiprocess_mode='livemax')
+
+
+class HedgePolicy:
+    '''
+    Decides when a slow batch is duplicated to a second worker.
+
+    A batch is hedged once it has been outstanding longer than the given percentile of recent batch
+    latencies, so only the slowest few percent are duplicated. Hedges are paid from a budget that
+    every dispatched batch refills by budget_ratio, so hedging adds at most that fraction of load,
+    also when all workers are slow and every batch would exceed the threshold.
+    '''
+
+    def __init__(self, percentile=0.95, budget_ratio=0.05, max_budget=10, window=500, min_samples=20):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)  # seconds
+        self._budget = 0.0
+
+    def observe(self, latency):
+        self._latencies.append(latency)
+
+    def dispatched(self):
+        self._budget = min(self.max_budget, self._budget + self.budget_ratio)
+
+    def threshold(self):
+        '''
+        Delay in seconds after which a batch should be hedged, or None while there are too few samples.
+        '''
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        threshold = latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))]
+        hedge_threshold_gauge.set(threshold)
+        return threshold
+
+    def try_acquire(self):
+        '''
+        Take one hedge from the budget. Returns False if the budget is used up.
+        '''
+        if self._budget < 1:
+            hedge_budget_exhausted_count.inc()
+            return False
+        self._budget -= 1
+        hedge_count.inc()
+        return True
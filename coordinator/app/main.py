@@ -1,78 +1,140 @@
 import asyncio
+import functools
 import logging
+import math
+import os
+import signal
 import socket
+import subprocess
+import sys
+import tempfile
 import time
 import uuid
 
 import custom_logging
 import grpc
 from grpc.experimental import aio
-from prometheus_client import start_http_server, Gauge, Counter
+from prometheus_client import start_http_server, CollectorRegistry, Gauge, Counter, multiprocess
 
-from proto.public_pb2 import EmbedRequest, EmbedResponse, ReturnCode, Embedding
+from proto.public_pb2 import EmbedRequest, EmbedResponse, ReturnCode, Embedding, Priority, TextError
 from proto.public_pb2_grpc import TextEmbeddingServicer, add_TextEmbeddingServicer_to_server
-from proto.private_pb2 import InferRequest, InferResponse, HeartbeatRequest, HeartbeatResponse, StatusCode
-from proto.private_pb2_grpc import WorkerStub
-from utility import DynIncAsyncSemaphore
+from proto.private_pb2 import (InferRequest, InferResponse, HeartbeatRequest, HeartbeatResponse, StatusCode,
+                               WatchStatusRequest)
+from batching import BatchWaitController, LengthBuckets, estimate_tokens
+from channel_pool import WorkerChannelPool, WorkerStreamError
+from circuit_breaker import CircuitBreakers
+from embedding_cache import EmbeddingCache
+from fair_queue import FairQueue
+from flow_control import WorkerCredits
+from hedging import HedgePolicy, hedge_win_count
+from retry_budget import RetryBudget
+from worker_selection import WorkerLoadTracker, create_policy
+from utility import embedding_rows, pack_rows, unpack_rows
 
 # Config
-MAX_BATCH_SIZE = 20
-MAX_BATCH_WAIT = 0.01  # seconds
+MAX_REQUEST_SIZE = int(os.environ.get("COORDINATOR_MAX_REQUEST_SIZE", 1000))  # Max texts per client request
+MAX_BATCH_SIZE = 20  # Texts per queue entry, larger client requests are queued as several shards
+MAX_BATCH_WAIT = float(os.environ.get("COORDINATOR_MAX_BATCH_WAIT", 0.05))  # seconds, upper bound of the adaptive wait
+LATENCY_SLO = float(os.environ.get("COORDINATOR_LATENCY_SLO", 0.25))  # seconds, target latency of a request
+MAX_BATCH_TEXTS = 256  # Max texts per worker batch, batches are normally limited by the token budget
+BATCH_TOKEN_BUDGET = int(os.environ.get("COORDINATOR_BATCH_TOKEN_BUDGET", 4096))  # Padded tokens per worker batch
+BUCKET_BOUNDARIES = (16, 32, 64, 128, 256)  # Upper estimated token lengths of the batch buckets
 WORKER_SERVICE_NAME = "worker"
 WORKER_PORT = 50051
 COORDINATOR_PORT = 50050
+METRICS_PORT = 8000
+COORDINATOR_PROCESSES = int(os.environ.get("COORDINATOR_PROCESSES", 1))  # Server processes sharing the port
+PROCESS_INDEX = os.environ.get("COORDINATOR_PROCESS_INDEX")  # Set in the server processes of a multi-process coordinator
 MAX_RETRIES = 3
-MAX_INFLIGHT_BATCHES_MULT = 4
-MAX_QUEUE_SIZE = 250
+WORKER_ERRORS = (grpc.aio.AioRpcError, WorkerStreamError, asyncio.TimeoutError)  # Failed worker calls
+BATCH_ERROR_CODES = (grpc.StatusCode.INTERNAL, grpc.StatusCode.INVALID_ARGUMENT)  # Unary Infer error responses
+TRANSPORT_ERROR_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)  # Calls that count against a worker
+RETRY_BUDGET = float(os.environ.get("COORDINATOR_RETRY_BUDGET", 0.2))  # Max retries per dispatched batch
+HEALTH_CHECK_INTERVAL = 5  # seconds, Heartbeat polling of workers that do not support WatchStatus
+WORKER_TIMEOUT = 2  # seconds, per worker call, shortened to the remaining client deadline
+CREDIT_INITIAL_WINDOW = 4  # Batches in flight per new worker, adapted per worker from its latency
+CREDIT_MAX_WINDOW = int(os.environ.get("COORDINATOR_CREDIT_MAX_WINDOW", 16))  # Max batches in flight per worker
+CREDIT_LATENCY_TOLERANCE = float(os.environ.get("COORDINATOR_CREDIT_LATENCY_TOLERANCE", 2.0))  # Recent vs long-term latency that shrinks a window
+MAX_QUEUE_SIZE = 250  # Per priority class
+TENANT_QUEUE_LIMIT = int(os.environ.get("COORDINATOR_TENANT_QUEUE_LIMIT", 100))  # Queued requests per named tenant
+PRIORITY_CLASSES = {Priority.PRIORITY_ONLINE: "online", Priority.PRIORITY_BULK: "bulk"}
+PRIORITY_WEIGHTS = {"online": 8, "bulk": 1}  # Share of the batch capacity per class under load
+WORKER_PACKED_EMBEDDINGS = True  # Request packed float32 buffers from workers
+USE_INFER_STREAM = os.environ.get("COORDINATOR_INFER_STREAM", "1") == "1"  # Long-lived InferStream instead of unary Infer
+STREAM_MAX_OUTSTANDING = CREDIT_MAX_WINDOW  # Batches in flight per worker stream
+STREAM_MAX_OUTSTANDING_REQUESTS = 64  # Requests processed concurrently per client EmbedStream
+CACHE_MAX_BYTES = int(os.environ.get("COORDINATOR_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 0 disables the cache
+CACHE_TTL = float(os.environ.get("COORDINATOR_CACHE_TTL", 3600))  # seconds
+HEDGE_ENABLED = os.environ.get("COORDINATOR_HEDGE", "0") == "1"  # Duplicate slow batches to a second worker
+HEDGE_PERCENTILE = float(os.environ.get("COORDINATOR_HEDGE_PERCENTILE", 0.95))  # Latency percentile after which a batch is hedged
+HEDGE_BUDGET = float(os.environ.get("COORDINATOR_HEDGE_BUDGET", 0.05))  # Max hedged batches per dispatched batch
+BREAKER_FAILURES = int(os.environ.get("COORDINATOR_BREAKER_FAILURES", 5))  # Consecutive failed calls that eject a worker
+BREAKER_ERROR_RATE = float(os.environ.get("COORDINATOR_BREAKER_ERROR_RATE", 0.5))  # Failed fraction of recent calls that ejects a worker
+BREAKER_LATENCY_FACTOR = float(os.environ.get("COORDINATOR_BREAKER_LATENCY_FACTOR", 5.0))  # Latency vs the median of the others that ejects a worker
+BREAKER_EJECTION = float(os.environ.get("COORDINATOR_BREAKER_EJECTION", 1.0))  # seconds, first ejection, doubled per repeated ejection
+WORKER_POLICY = os.environ.get("COORDINATOR_WORKER_POLICY", "p2c")  # round_robin, least_outstanding, ewma or p2c
 
 
 # --------------------------- Shared State ---------------------------
-request_queue = asyncio.Queue(MAX_QUEUE_SIZE)
-inflight_semaphore = DynIncAsyncSemaphore(MAX_INFLIGHT_BATCHES_MULT)
+request_queue = FairQueue(PRIORITY_WEIGHTS, MAX_QUEUE_SIZE, TENANT_QUEUE_LIMIT)
+worker_credits = WorkerCredits(CREDIT_INITIAL_WINDOW, 1, CREDIT_MAX_WINDOW, CREDIT_LATENCY_TOLERANCE)
+channel_pool = WorkerChannelPool(WORKER_PORT, stream_max_outstanding=STREAM_MAX_OUTSTANDING)
+embedding_cache = EmbeddingCache(CACHE_MAX_BYTES, CACHE_TTL)
+inflight_texts = {}  # text -> future of its embedding row, for texts queued or being processed
+inflight_deadlines = {}  # text -> latest client deadline (loop time) of the requests waiting for it
+worker_loads = WorkerLoadTracker()
+worker_policy = create_policy(WORKER_POLICY, worker_loads)
+hedge_policy = HedgePolicy(HEDGE_PERCENTILE, HEDGE_BUDGET)
+retry_budget = RetryBudget(RETRY_BUDGET)
+circuit_breakers = CircuitBreakers(BREAKER_FAILURES, BREAKER_ERROR_RATE, latency_factor=BREAKER_LATENCY_FACTOR,
+                                   base_ejection=BREAKER_EJECTION)
 
 
 class WorkerState:
     worker_ips = []
     worker_health = {}
-    worker_index = 0
+    worker_token_budget = {}
+    worker_load = {}  # Last HeartbeatResponse per worker
 # --------------------------------------------------------------------
 
 request_count = Counter('coordinator_request_count', 'Total number of requests received by the coordinator')
-request_queue_gauge = Gauge('coordinator_queue_size', 'Number of requests in the coordinator queue')
-worker_count_gauge = Gauge('coordinator_worker_count', 'Number of workers registered with the coordinator')
+request_queue_gauge = Gauge('coordinator_queue_size', 'Number of requests in the coordinator queue', multiprocess_mode='livesum')
+worker_count_gauge = Gauge('coordinator_worker_count', 'Number of workers registered with the coordinator', multiprocess_mode='livemax')
 request_queue_full_count = Counter('coordinator_queue_full_count', 'Number of requests declined due to full queue')
 request_timeout_count = Counter('coordinator_request_timeout_count', 'Number of requests that timed out waiting for a worker')
+overloaded_count = Counter('coordinator_overloaded_count', 'Number of requests declined because all workers reported overload')
+expired_text_count = Counter('coordinator_expired_text_count', 'Number of texts dropped because their client deadline had passed')
+partial_response_count = Counter('coordinator_partial_response_count', 'Number of responses in which some but not all texts failed')
+split_batch_count = Counter('coordinator_split_batch_count', 'Number of failed batches split in half to isolate failing texts')
+coalesced_text_count = Counter('coordinator_coalesced_text_count', 'Number of texts attached to an identical queued or in-flight text')
+
+
+class DispatchError(Exception):
+    '''
+    Raised into the futures of a batch that could not be processed by any worker.
+    '''
+
+
+def make_embed_response(ids, rows, packed, errors=()):
+    '''
+    Build a client response from embedding rows in the format the client asked for.
+    The rows of failed texts are None, the response is then PARTIAL and lists them in errors.
+    '''
+    code, msg = ReturnCode.OK, ""
+    if errors:
+        code, msg = ReturnCode.PARTIAL, f"{len(errors)} of {len(ids)} texts failed."
+    if packed:
+        return EmbedResponse(ids=ids, packed_embeddings=pack_rows(rows), code=code, return_msg=msg, errors=errors)
+    return EmbedResponse(ids=ids, embeddings=unpack_rows(rows), code=code, return_msg=msg, errors=errors)
 
 class TextEmbeddingServicerImpl(TextEmbeddingServicer):
     async def Embed(self, request, context):
         try:
-            if len(request.texts) > MAX_BATCH_SIZE:
-                logging.warning(
-                    f"Request declined: invalid batch size {len(request.texts)} > max batch size {MAX_BATCH_SIZE}.")
-                context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-                msg = f"Batch size exceeds maximum of {MAX_BATCH_SIZE}."
-                context.set_details(msg)
-                return EmbedResponse(
-                    ids=[],
-                    embeddings=[],
-                    code=ReturnCode.ERROR,
-                    return_msg=msg)
-            if request_queue.full():
-                request_queue_full_count.inc()  # Increment the declined counter
-                logging.warning(
-                    f"Request declined: queue is full.")
-                context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
-                msg = f"Request queue is full. Try again later."
-                context.set_details(msg)
-                return EmbedResponse(
-                    ids=[],
-                    embeddings=[],
-                    code=ReturnCode.ERROR,
-                    return_msg=msg)
-            future = asyncio.get_event_loop().create_future()
-            await request_queue.put((request, future))
-            logging.debug(f"Received request with batch size {len(request.texts)}.")
-            return await future
+            response, status = await self.embed(request, wait_for_queue=False, expires_at=client_deadline(context))
+            if status is not None:
+                context.set_code(status)
+                context.set_details(response.return_msg)
+            return response
         except asyncio.CancelledError:
             request_timeout_count.inc()
             msg = f"Request cancelled due to timeout."
@@ -82,106 +144,372 @@ class TextEmbeddingServicerImpl(TextEmbeddingServicer):
                 embeddings=[],
                 code=ReturnCode.ERROR,
                 return_msg=msg)
+
+    async def EmbedStream(self, request_iterator, context):
+        """
+        Bulk API: embed requests pushed continuously on one stream and send each response back as soon
+        as it is complete, tagged with the request_id of its request. Up to STREAM_MAX_OUTSTANDING_REQUESTS
+        requests are processed or waiting to be sent concurrently. Beyond that, or when the queue is full,
+        reading pauses and gRPC flow control pushes back on the client instead of declining requests, also
+        when the client stops reading the responses.
+        """
+        responses = asyncio.Queue()
+        slots = asyncio.Semaphore(STREAM_MAX_OUTSTANDING_REQUESTS)
+        tasks = set()
+        expires_at = client_deadline(context)
+
+        async def process(request):
+            try:
+                response, _ = await self.embed(request, wait_for_queue=True, expires_at=expires_at)
+            except BaseException:
+                slots.release()
+                raise
+            response.request_id = request.request_id
+            # The slot is released once the response is sent
+            responses.put_nowait(response)
+
+        async def read():
+            try:
+                async for request in request_iterator:
+                    await slots.acquire()
+                    task = asyncio.create_task(process(request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+            finally:
+                await responses.put(None)
+
+        reader = asyncio.create_task(read())
+        try:
+            while (response := await responses.get()) is not None:
+                yield response
+                slots.release()
         finally:
-            request_count.inc()
-            
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def embed(self, request, wait_for_queue, expires_at=math.inf):
+        """
+        Compute the embeddings for an EmbedRequest, serving cached texts directly.
+        Requests of more than MAX_BATCH_SIZE texts are queued as several shards, which are batched and
+        dispatched to the workers in parallel. Texts that fail are reported per text in a PARTIAL response.
+        If the queue is full, the request is declined, or waits for space if wait_for_queue is set.
+        Texts are dropped instead of dispatched once expires_at (the client deadline in loop time) has passed.
+        Returns the response and the gRPC status code to fail a unary call with, or None on success.
+        """
+        request_count.inc()
+        if len(request.texts) > MAX_REQUEST_SIZE:
+            logging.warning(
+                f"Request declined: invalid batch size {len(request.texts)} > max request size {MAX_REQUEST_SIZE}.")
+            msg = f"Batch size exceeds maximum of {MAX_REQUEST_SIZE}."
+            return EmbedResponse(
+                ids=[],
+                embeddings=[],
+                code=ReturnCode.ERROR,
+                return_msg=msg), grpc.StatusCode.INVALID_ARGUMENT
+        logging.debug(f"Received request with batch size {len(request.texts)}.")
+        texts = list(request.texts)
+        ids = [str(uuid.uuid4()) for _ in texts]
+        # Serve what we can from the cache and only queue the misses
+        model_ids = serving_models()
+        rows = [embedding_cache.get(text, model_ids) for text in texts]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        if misses:
+            priority = PRIORITY_CLASSES.get(request.priority, "online")
+            # Texts already in flight are not queued again, the queue needs room for a shard per MAX_BATCH_SIZE others
+            shards = math.ceil(len({texts[i] for i in misses if texts[i] not in inflight_texts}) / MAX_BATCH_SIZE)
+            if not wait_for_queue and shards and request_queue.full(priority, request.tenant, shards):
+                request_queue_full_count.inc()  # Increment the declined counter
+                logging.warning(
+                    f"Request declined: queue is full.")
+                msg = f"Request queue is full. Try again later."
+                return EmbedResponse(
+                    ids=[],
+                    embeddings=[],
+                    code=ReturnCode.ERROR,
+                    return_msg=msg), grpc.StatusCode.RESOURCE_EXHAUSTED
+            if not wait_for_queue and workers_overloaded():
+                overloaded_count.inc()
+                logging.warning(
+                    f"Request declined: all workers are overloaded.")
+                msg = f"Workers are overloaded. Try again later."
+                return EmbedResponse(
+                    ids=[],
+                    embeddings=[],
+                    code=ReturnCode.ERROR,
+                    return_msg=msg), grpc.StatusCode.RESOURCE_EXHAUSTED
+            futures, new_texts, new_ids, new_futures = claim_texts(texts, ids, misses, expires_at)
+            if new_texts:
+                try:
+                    for start in range(0, len(new_texts), MAX_BATCH_SIZE):
+                        shard = slice(start, start + MAX_BATCH_SIZE)
+                        entry = (new_texts[shard], new_ids[shard], new_futures[shard], expires_at)
+                        if wait_for_queue:
+                            await request_queue.put(entry, priority, request.tenant, cost=len(new_texts[shard]))
+                        else:
+                            # Room for all shards was checked above, nothing ran in between
+                            request_queue.put_nowait(entry, priority, request.tenant, cost=len(new_texts[shard]))
+                except asyncio.CancelledError:
+                    # Not (completely) queued, release the texts so nobody waits for them
+                    for fut in new_futures:
+                        fut.cancel()
+                    raise
+            # Futures may be shared with other requests, so they must not be cancelled with this one
+            await asyncio.wait(set(futures))
+            errors = []
+            for i, fut in zip(misses, futures):
+                if fut.cancelled():
+                    errors.append(TextError(index=i, message="Request for a shared text was cancelled."))
+                elif fut.exception() is not None:
+                    errors.append(TextError(index=i, message=str(fut.exception())))
+                else:
+                    rows[i] = fut.result()
+            if len(errors) == len(texts):
+                return EmbedResponse(ids=ids, embeddings=[], code=ReturnCode.ERROR,
+                                     return_msg=errors[0].message, errors=errors), None
+            if errors:
+                partial_response_count.inc()
+            return make_embed_response(ids, rows, request.packed, errors), None
+        return make_embed_response(ids, rows, request.packed), None
+
+
+def client_deadline(context):
+    '''
+    Deadline of the client call in event loop time, or infinity if the client did not set one.
+    '''
+    remaining = context.time_remaining()
+    if remaining is None:
+        return math.inf
+    return asyncio.get_event_loop().time() + remaining
+
+
+def claim_texts(texts, ids, indices, expires_at):
+    '''
+    Get a future for the embedding of each text at the given indices.
+    Texts that are already queued or in flight, or repeated within the request, share one future.
+    A shared text is kept until the latest deadline of the requests waiting for it.
+    Returns the futures and the texts, ids and futures that still need to be queued.
+    '''
+    futures = []
+    new_texts, new_ids, new_futures = [], [], []
+    for i in indices:
+        fut = inflight_texts.get(texts[i])
+        if fut is None:
+            fut = asyncio.get_event_loop().create_future()
+            fut.add_done_callback(functools.partial(release_text, texts[i]))
+            inflight_texts[texts[i]] = fut
+            inflight_deadlines[texts[i]] = expires_at
+            new_texts.append(texts[i])
+            new_ids.append(ids[i])
+            new_futures.append(fut)
+        else:
+            coalesced_text_count.inc()
+            inflight_deadlines[texts[i]] = max(inflight_deadlines.get(texts[i], math.inf), expires_at)
+        futures.append(fut)
+    return futures, new_texts, new_ids, new_futures
+
+
+def release_text(text, fut):
+    if inflight_texts.get(text) is fut:
+        del inflight_texts[text]
+        inflight_deadlines.pop(text, None)
+    if not fut.cancelled():
+        fut.exception()  # Mark as retrieved, all waiters may have given up
 
 
 async def batching_loop():
     """
-    Start loop that consumes the request queue and aggregates requests up to MAX_BATCH_SIZE.
-    Requests are delayed up to MAX_BATCH_WAIT seconds to allow for more requests to accumulate.
-    The actual wait time is dynamically adjusted based on the fill level of the waiting batch. So that
-    if the batch is small, it waits longer to allow more requests to come in.
-
-    The aggregated batches are only dispatched to workers if inflight worker requests are below 
-    a set threshold. The threshold is dynamically updated based on the number of workers available.
+    Start loop that consumes the request queue and aggregates texts into batches.
+    Texts are bucketed by estimated sequence length, so a batch is not padded to the length of one
+    long text. A batch is full when its padded size (texts x longest text) reaches the token budget
+    of the workers. Each bucket is delayed up to MAX_BATCH_WAIT seconds to allow for more texts to
+    accumulate. The actual wait time is chosen by a BatchWaitController from the arrival rate, the worker
+    latency and the utilization of the worker credits.
+
+    The aggregated batches are only dispatched when a worker has a free credit, see WorkerCredits.
+    Up to MAX_BATCH_TEXTS queued texts are taken per iteration, in the weighted fair order of the
+    priority classes, and ready batches are dispatched earliest client deadline first. Buckets are
+    flushed early when a deadline would otherwise be missed.
     """
-    global inflight_semaphore
-    retained = None
+    buckets = LengthBuckets(BUCKET_BOUNDARIES, BATCH_TOKEN_BUDGET, MAX_BATCH_TEXTS, MAX_BATCH_WAIT)
+    wait_controller = BatchWaitController(MAX_BATCH_WAIT, LATENCY_SLO)
+    loop = asyncio.get_event_loop()
     while True:
-        requests = []
-        futures = []
-        all_texts = []
-        all_ids = []
-        counts = []
-
-        if not retained:
-            req, fut = await request_queue.get()
-        else:
-            req, fut = retained
-            retained = None
-        requests.append(req)
-        futures.append(fut)
-        all_texts.extend(req.texts)
-        ids = [str(uuid.uuid4()) for _ in req.texts]
-        all_ids.extend(ids)
-        counts.append(len(req.texts))
+        ready = []
+        buckets.token_budget = batch_token_budget()
+        worker_latency = (worker_loads.mean_latency() or 0) / 1000
+        buckets.dispatch_margin = worker_latency
+        buckets.max_wait = wait_controller.window(
+            loop.time(), buckets.token_budget, worker_latency, worker_credits.utilization(WorkerState.worker_ips))
+        deadline = buckets.next_deadline()
+        try:
+            if deadline is None:
+                entries = [await request_queue.get()]
+            else:
+                entries = [await asyncio.wait_for(request_queue.get(), timeout=max(0, deadline - loop.time()))]
+            drained = len(entries[0][0])
+            while not request_queue.empty() and drained < MAX_BATCH_TEXTS:
+                entries.append(request_queue.get_nowait())
+                drained += len(entries[-1][0])
+            now = loop.time()
+            for texts, ids, futures, expires_at in entries:
+                for text, id, fut in zip(texts, ids, futures):
+                    wait_controller.observe_arrival(estimate_tokens(text), now)
+                    ready.extend(buckets.add(text, id, fut, now, expires_at))
+        except asyncio.TimeoutError:
+            pass
+        ready.extend(buckets.pop_due(loop.time()))
+        ready.sort(key=lambda batch: batch.expires_at)
+        for batch in ready:
+            await dispatch_batch(batch)
+
+
+def batch_token_budget():
+    """
+    Token budget for new batches: the smallest budget reported by a known worker, so every batch fits
+    any worker it may be dispatched to. Workers that do not report a budget use BATCH_TOKEN_BUDGET.
+    """
+    budgets = [WorkerState.worker_token_budget.get(ip) or BATCH_TOKEN_BUDGET for ip in WorkerState.worker_ips]
+    return min(budgets, default=BATCH_TOKEN_BUDGET)
 
-        start = asyncio.get_event_loop().time()
 
-        while len(all_texts) < MAX_BATCH_SIZE:
-            dynamic_wait = MAX_BATCH_WAIT * len(all_texts) / MAX_BATCH_SIZE
-            elapsed = asyncio.get_event_loop().time() - start
-            timeout = dynamic_wait - elapsed
-            try:
-                req, fut = await asyncio.wait_for(request_queue.get(), timeout=max(0, timeout))
-                if len(all_texts) + len(req.texts) > MAX_BATCH_SIZE:
-                    retained = (req, fut)  # Retain the request that exceeds the batch size
-                    break
-                requests.append(req)
-                futures.append(fut)
-                all_texts.extend(req.texts)
-                all_ids.extend([str(uuid.uuid4()) for _ in req.texts])
-                counts.append(len(req.texts))
-            except asyncio.TimeoutError:
-                break
-
-        worker_request = InferRequest(
-            input_data=all_texts,
-            ids=all_ids
-        )
-        await inflight_semaphore.acquire()
-
-        async def wrapped_dispatch(worker_request, futures, counts):
-            try:
-                await dispatch_coro(worker_request, futures, counts)
-            finally:
-                await inflight_semaphore.release()
-        asyncio.create_task(wrapped_dispatch(worker_request, futures, counts))
-        # asyncio.create_task(wrapped_dispatch())
+async def dispatch_batch(batch):
+    """
+    Wait for a worker with a free credit, at most until the earliest client deadline of the batch, and
+    dispatch the batch to it in the background. Texts whose client deadline passed while waiting are
+    dropped, nobody would receive their embedding.
+    """
+    try:
+        worker_ip = await acquire_worker(batch.expires_at)
+    except (RuntimeError, asyncio.TimeoutError):
+        # No worker available, or no credit before the earliest deadline of the batch. Expired texts are
+        # dropped below, dispatch_coro waits for a worker for the others.
+        worker_ip = None
+    now = asyncio.get_event_loop().time()
+    texts, ids, futures, expired = [], [], [], []
+    for text, id, fut in zip(batch.texts, batch.ids, batch.futures):
+        if fut.done():
+            continue
+        if inflight_deadlines.get(text, math.inf) <= now:
+            expired.append(fut)
+        else:
+            texts.append(text)
+            ids.append(id)
+            futures.append(fut)
+    if expired:
+        expired_text_count.inc(len(expired))
+        logging.warning(f"Dropped {len(expired)} texts whose client deadline passed before dispatch.")
+        fail_futures(expired, "Deadline exceeded before dispatch.")
+    if not texts:
+        if worker_ip is not None:
+            release_worker(worker_ip)
+        return
+    worker_request = InferRequest(
+        input_data=texts,
+        ids=ids,
+        packed=WORKER_PACKED_EMBEDDINGS
+    )
+    expires_at = max(inflight_deadlines.get(text, math.inf) for text in texts)
+    retry_budget.dispatched()
+    asyncio.create_task(dispatch_coro(worker_request, futures, expires_at, worker_ip))
 
 
-async def health_check_loop(interval=5):
+async def status_watch_loop(interval=1):
     """
-    Start loop, that periodically probes workers and updates their health status in the WorkerState.
+    Start loop, that keeps a status watch running for every resolved worker, see watch_worker_status,
+    and drops the state of workers that were removed. Broken watches are restarted every interval seconds.
     """
+    watches = {}
     while True:
+        for worker_ip in list(watches):
+            if worker_ip not in WorkerState.worker_ips:
+                watches.pop(worker_ip).cancel()
         for k in list(WorkerState.worker_health):
             if k not in WorkerState.worker_ips:
                 del WorkerState.worker_health[k]
-        await asyncio.gather(*(health_check_coro(ip) for ip in WorkerState.worker_ips), asyncio.sleep(interval))
-        logging.info(f"Worker health report: {WorkerState.worker_health}")
+                WorkerState.worker_token_budget.pop(k, None)
+                WorkerState.worker_load.pop(k, None)
+        worker_loads.forget(WorkerState.worker_ips)
+        worker_credits.forget(WorkerState.worker_ips)
+        circuit_breakers.forget(WorkerState.worker_ips)
+        for worker_ip in WorkerState.worker_ips:
+            if worker_ip not in watches or watches[worker_ip].done():
+                watches[worker_ip] = asyncio.create_task(watch_worker_status(worker_ip))
+        await asyncio.sleep(interval)
+
+
+async def watch_worker_status(worker_ip):
+    '''
+    Follow the WatchStatus stream of a worker, which pushes its status and load as they change.
+    When the stream breaks, e.g. because the worker crashed, the worker is marked unavailable at once.
+    Workers that do not implement WatchStatus are polled with Heartbeat instead.
+    '''
+    addr = f"{worker_ip}:{WORKER_PORT}"
+    try:
+        stub = channel_pool.get_stub(worker_ip)
+        async for resp in stub.WatchStatus(WatchStatusRequest()):
+            update_worker_status(worker_ip, resp)
+        mark_worker_unavailable(worker_ip, f"Status stream of {addr} closed by the worker.")
+    except grpc.aio.AioRpcError as e:
+        if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+            logging.info(f"Worker {addr} does not support WatchStatus, polling its health.")
+            while True:
+                await health_check_coro(worker_ip)
+                await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        mark_worker_unavailable(worker_ip, f"Status stream of {addr} failed: {e.code()} {e.details()}")
+    except Exception as e:
+        mark_worker_unavailable(worker_ip, f"Status stream of {addr} failed: {e}")
 
 
 async def health_check_coro(worker_ip):
     '''
-    Check the health of a worker and update the shared worker health state.
+    Check the health of a worker with a Heartbeat call and update the shared worker health state.
     '''
     addr = f"{worker_ip}:{WORKER_PORT}"
     try:
-        async with aio.insecure_channel(addr) as channel:
-            stub = WorkerStub(channel)
-            resp = await stub.Heartbeat(HeartbeatRequest(), timeout=2)
-            WorkerState.worker_health[worker_ip] = resp.status
+        stub = channel_pool.get_stub(worker_ip)
+        resp = await stub.Heartbeat(HeartbeatRequest(), timeout=2)
+        update_worker_status(worker_ip, resp)
     except Exception as e:
-        WorkerState.worker_health[worker_ip] = StatusCode.STATUS_UNAVAILABLE
-        logging.error(f"Health check failed for {addr}", exc_info=True)
+        mark_worker_unavailable(worker_ip, f"Health check failed for {addr}: {e}")
+
+
+def update_worker_status(worker_ip, resp):
+    '''
+    Apply a status report (HeartbeatResponse) of a worker to the shared worker state.
+    '''
+    previous = WorkerState.worker_health.get(worker_ip)
+    WorkerState.worker_health[worker_ip] = resp.status
+    WorkerState.worker_token_budget[worker_ip] = resp.max_batch_tokens
+    WorkerState.worker_load[worker_ip] = resp
+    worker_loads.report(worker_ip, resp.capacity, resp.latency_p50_ms)
+    if resp.status != previous:
+        logging.info(
+            f"Worker {worker_ip} status {StatusCode.Name(resp.status)}: inflight={resp.inflight_batches} "
+            f"queue_depth={resp.queue_depth} p50={resp.latency_p50_ms:.1f}ms p99={resp.latency_p99_ms:.1f}ms "
+            f"cpu={resp.cpu_utilization:.2f}")
+
+
+def serving_models():
+    '''
+    Model identities reported by the available workers, "" if none reported one. Only cached
+    embeddings of these models are served.
+    '''
+    return {resp.model_id for resp in WorkerState.worker_load.values()} or {""}
+
+
+def mark_worker_unavailable(worker_ip, msg):
+    if WorkerState.worker_health.get(worker_ip) != StatusCode.STATUS_UNAVAILABLE:
+        logging.error(msg)
+    WorkerState.worker_health[worker_ip] = StatusCode.STATUS_UNAVAILABLE
+    WorkerState.worker_load.pop(worker_ip, None)
 
 
 async def resolve_worker_loop(interval=10):
     """
     Periodically resolve worker IPs and update the shared list in-place.
+    The channel pool is synced to the resolved list, so new workers are connected eagerly.
     """
     while True:
         try:
@@ -192,121 +520,311 @@ async def resolve_worker_loop(interval=10):
             WorkerState.worker_ips.clear()
             WorkerState.worker_ips.extend(new_ips)
             logging.debug(f"Resolved worker IPs: {WorkerState.worker_ips}")
-            await inflight_semaphore.update_threshold(
-                len(WorkerState.worker_ips) * MAX_INFLIGHT_BATCHES_MULT)
+            await channel_pool.sync(new_ips)
         except Exception:
             logging.error(f"Could not resolve worker IPs.", exc_info=True)
         await asyncio.sleep(interval)
 
 
-async def dispatch_coro(worker_request, futures, counts):
+async def dispatch_coro(worker_request, futures, expires_at=math.inf, worker_ip=None):
     '''
-    Dispatch a batch of requests to a worker, retrying on failure.
-    Handles the response and fulfills futures with the result or error.
+    Dispatch a batch of texts to a worker, retrying on failure.
+    Handles the response and fulfills the per-text futures with the embedding row or error.
+    Worker calls are limited to the time left until expires_at, the latest client deadline of the batch.
+    worker_ip is a worker whose credit was already taken for the first attempt, retries wait for a credit.
+    Retries go to workers that did not fail the batch yet, as long as there are any, and are paid
+    from the retry budget. Batches that still fail are split in half, see split_or_fail.
+    Batches whose call failed because the client deadline passed are failed as expired, without retry.
     '''
+    loop = asyncio.get_event_loop()
     retry_count = 0
-    while retry_count <= MAX_RETRIES:
+    failed_workers = set()
+    while True:
+        timeout = min(WORKER_TIMEOUT, expires_at - loop.time())
+        if timeout <= 0:
+            if worker_ip is not None:
+                release_worker(worker_ip)
+            fail_expired(worker_request, futures, retry_count)
+            return
         # Send request to worker
         try:
-            worker_ip = pick_worker()
-            worker_addr = f"{worker_ip}:{WORKER_PORT}"
-            start_time = time.time()
-            async with aio.insecure_channel(worker_addr) as channel:
-                stub = WorkerStub(channel)
-                worker_response = await stub.Infer(worker_request, timeout=2)
-                latency = (time.time() - start_time) * 1000  # ms
-                logging.info(
-                    f"Batch processed: worker_id={worker_response.worker_id:<10} "
-                    f"ids={[id[:8] for id in worker_response.ids]} latency={latency:.2f}ms retry_count={retry_count} "
-                    f"code={worker_response.code} return_msg={worker_response.return_msg}"
-                )
+            if worker_ip is None:
+                try:
+                    worker_ip = await acquire_worker(expires_at, failed_workers)
+                except RuntimeError:
+                    # Every available worker failed the batch already, let any of them retry it
+                    worker_ip = await acquire_worker(expires_at)
+            if HEDGE_ENABLED:
+                worker_response, latency = await infer_hedged(worker_ip, worker_request, timeout)
+            else:
+                worker_response, latency = await infer_on_worker(worker_ip, worker_request, timeout)
+            logging.info(
+                f"Batch processed: worker_id={worker_response.worker_id:<10} "
+                f"ids={[id[:8] for id in worker_response.ids]} latency={latency:.2f}ms retry_count={retry_count} "
+                f"code={worker_response.code} return_msg={worker_response.return_msg}"
+            )
             break
-        except grpc.aio.AioRpcError:
+        except WORKER_ERRORS as e:
+            if loop.time() >= expires_at or deadline_timeout(e, timeout):
+                # The clients gave up, a retry or split would only spend the retry budget. Not the worker's fault.
+                fail_expired(worker_request, futures, retry_count)
+                return
             logging.error(
                 f"Batch dispatch failed: worker={worker_ip}, request_ids={[id[:8] for id in worker_request.ids]} "
                 f"retry_count={retry_count}", exc_info=True)
-            retry_count += 1
-            await asyncio.sleep(0.1 * retry_count)
+            if worker_ip is not None:
+                failed_workers.add(worker_ip)
         except Exception as e:
             logging.error(
                 f"Batch dispatch failed: request_ids={[id[:8] for id in worker_request.ids]} "
                 f"retry_count={retry_count}", exc_info=True)
-            retry_count += 1
-            await asyncio.sleep(0.1 * retry_count)
-    else:
-        # If we exhausted all retries, fulfill futures with an error response
-        logging.error(
-            f"Max retries exceeded for request_ids={[id[:8] for id in worker_request.ids]}")
-        idx = 0
-        for fut, cnt in zip(futures, counts):
-            ids = worker_request.ids[idx:idx+cnt]
-            client_response = EmbedResponse(
-                ids=ids, embeddings=[], code=ReturnCode.ERROR,
-                return_msg="Downstream worker reached max retries.")
-            if not fut.done():
-                fut.set_result(client_response)
-            idx += cnt
-        return
+        finally:
+            worker_ip = None  # The credit was returned by the call
+        retry_count += 1
+        if retry_count > MAX_RETRIES:
+            logging.error(
+                f"Max retries exceeded for request_ids={[id[:8] for id in worker_request.ids]}")
+            await split_or_fail(worker_request, futures, expires_at, "Downstream worker reached max retries.")
+            return
+        if not retry_budget.try_acquire():
+            logging.error(
+                f"Retry budget exhausted, not retrying request_ids={[id[:8] for id in worker_request.ids]}")
+            fail_futures(futures, "Downstream worker failed, retry budget exhausted.")
+            return
+        await asyncio.sleep(0.1 * retry_count)
 
     # Otherwise, fullfill futures with the worker response
     if worker_response.code == ReturnCode.OK:
         # Make sure we have a valid response, otherwise return error based on request ids
         try:
-            idx = 0
-            for fut, cnt in zip(futures, counts):
-                embeddings = worker_response.embeddings[idx:idx+cnt]
-                ids = worker_response.ids[idx:idx+cnt]
-                client_response = EmbedResponse(
-                    ids=ids, embeddings=embeddings, code=ReturnCode.OK, return_msg="")
+            rows = embedding_rows(worker_response)
+            if len(rows) != len(worker_request.input_data):
+                raise ValueError(f"Expected {len(worker_request.input_data)} embeddings, got {len(rows)}.")
+            for text, row in zip(worker_request.input_data, rows):
+                embedding_cache.put(text, row, worker_response.model_id)
+            for fut, row in zip(futures, rows):
                 if not fut.done():
-                    fut.set_result(client_response)
-                idx += cnt
+                    fut.set_result(row)
         except Exception as e:
             logging.error(
                 f"Error processing worker response: request_ids={[id[:8] for id in worker_request.ids]}", exc_info=True)
-            idx = 0
-            for fut, cnt in zip(futures, counts):
-                ids = worker_request.ids[idx:idx+cnt]
-                client_response = EmbedResponse(
-                    ids=ids, embeddings=[], code=ReturnCode.ERROR,
-                    return_msg="Error processing result.")
-                if not fut.done():
-                    fut.set_result(client_response)
-                idx += cnt
+            fail_futures(futures, "Error processing result.")
     else:
         logging.error(
             f"Worker returned not ok: code={worker_response.code}, msg={worker_response.return_msg}, "
             f"request_ids={[id[:8] for id in worker_request.ids]}")
-        idx = 0
-        for fut, cnt in zip(futures, counts):
-            ids = worker_request.ids[idx:idx+cnt]
-            client_response = EmbedResponse(
-                ids=ids, embeddings=[], code=ReturnCode.ERROR,
-                return_msg="Error processing request")
-            if not fut.done():
-                fut.set_result(client_response)
-            idx += cnt
+        await split_or_fail(worker_request, futures, expires_at, "Error processing request")
+
+
+async def split_or_fail(worker_request, futures, expires_at, msg):
+    '''
+    Dispatch the two halves of a failed batch separately, so a text the workers cannot process only
+    fails its own requests instead of everyone in the batch. Halves that fail are split again.
+    Single texts, and batches without retry budget left, fail with msg.
+    '''
+    texts = len(worker_request.input_data)
+    if texts < 2 or not retry_budget.try_acquire():
+        fail_futures(futures, msg)
+        return
+    split_batch_count.inc()
+    logging.warning(f"Splitting failed batch of {texts} texts: request_ids={[id[:8] for id in worker_request.ids]}")
+    await asyncio.gather(*(
+        dispatch_coro(
+            InferRequest(input_data=worker_request.input_data[half], ids=worker_request.ids[half],
+                         packed=worker_request.packed),
+            futures[half], expires_at)
+        for half in (slice(0, texts // 2), slice(texts // 2, texts))))
+
+
+async def infer_on_worker(worker_ip, worker_request, timeout):
+    '''
+    Send a batch to a worker and record its latency. Returns the response and the latency in ms.
+    Unary calls the worker fails with a status of BATCH_ERROR_CODES are returned as error responses.
+    The caller holds a credit of the worker, it is returned when the call ends. The outcome feeds
+    the credit window and the circuit breaker of the worker. Only transport failures count against it, see
+    transport_failure. Error responses and other statuses are usually caused by the batch, see split_or_fail.
+    '''
+    # The window compares latencies per batch size, the worker pads every text to the longest one
+    padded_tokens = len(worker_request.input_data) * max(map(estimate_tokens, worker_request.input_data), default=0)
+    start_time = time.time()
+    worker_loads.start(worker_ip)
+    completed, failed = False, False
+    try:
+        if USE_INFER_STREAM:
+            worker_response = await channel_pool.get_stream(worker_ip).infer(worker_request, timeout=timeout)
+        else:
+            stub = channel_pool.get_stub(worker_ip)
+            try:
+                worker_response = await stub.Infer(worker_request, timeout=timeout)
+            except grpc.aio.AioRpcError as e:
+                if e.code() not in BATCH_ERROR_CODES:
+                    raise
+                # The worker failed the call for the batch, handled like an error response on the stream
+                worker_response = InferResponse(code=ReturnCode.ERROR, return_msg=e.details() or "")
+        completed = True
+    except WORKER_ERRORS as e:
+        failed = transport_failure(e, timeout)
+        raise
+    finally:
+        # Cancelled hedging losers record the time until cancellation, a lower bound of their latency
+        latency = (time.time() - start_time) * 1000  # ms
+        worker_loads.finish(worker_ip, latency)
+        # Calls that failed for other reasons than the worker count as abandoned
+        worker_credits.release(worker_ip, latency if completed else None, failed, padded_tokens)
+        circuit_breakers.record(worker_ip, True if completed else False if failed else None, latency)
+        hedge_policy.observe(latency / 1000)
+    return worker_response, latency
+
+
+async def infer_hedged(worker_ip, worker_request, timeout):
+    '''
+    Send a batch to a worker, and if it has not answered within the hedge threshold, send a duplicate
+    to a different worker. The first successful response wins and the other call is cancelled.
+    '''
+    hedge_policy.dispatched()
+    primary = asyncio.create_task(infer_on_worker(worker_ip, worker_request, timeout))
+    pending = {primary}
+    try:
+        threshold = hedge_policy.threshold()
+        if threshold is None:
+            return await primary
+        if threshold >= timeout:
+            return await primary
+        done, _ = await asyncio.wait(pending, timeout=threshold)
+        if done:
+            return primary.result()
+        try:
+            hedge_ip = pick_worker(exclude=(worker_ip,), overcommit=True)
+        except RuntimeError:
+            return await primary
+        if not hedge_policy.try_acquire():
+            release_worker(hedge_ip)
+            return await primary
+        logging.info(f"Hedging batch: request_ids={[id[:8] for id in worker_request.ids]} worker={worker_ip} "
+                     f"hedge_worker={hedge_ip} threshold={threshold * 1000:.2f}ms")
+        hedge = asyncio.create_task(infer_on_worker(hedge_ip, worker_request, timeout - threshold))
+        pending.add(hedge)
+        result = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result()[0].code == ReturnCode.OK:
+                    if task is hedge:
+                        hedge_win_count.inc()
+                    return task.result()
+                result = task
+        # Neither call succeeded, surface the outcome of the last one
+        return result.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def deadline_timeout(e, timeout):
+    '''
+    True if a worker call failed with a timeout and its timeout was shortened to the client deadline,
+    i.e. the call was cut short by the client and not by a worker that exceeded WORKER_TIMEOUT.
+    '''
+    if timeout >= WORKER_TIMEOUT:
+        return False
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    return isinstance(e, grpc.aio.AioRpcError) and e.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+
+
+def transport_failure(e, timeout):
+    '''
+    True if a worker call failed because of the worker or the connection to it: its stream broke, it was
+    unavailable, or it exceeded WORKER_TIMEOUT. Not for calls cut short by the client deadline.
+    '''
+    if deadline_timeout(e, timeout):
+        return False
+    if isinstance(e, grpc.aio.AioRpcError):
+        return e.code() in TRANSPORT_ERROR_CODES
+    return True
+
+
+def fail_expired(worker_request, futures, retry_count):
+    expired_text_count.inc(len(futures))
+    logging.warning(
+        f"Client deadline passed for request_ids={[id[:8] for id in worker_request.ids]} "
+        f"retry_count={retry_count}")
+    fail_futures(futures, "Deadline exceeded.")
+
+
+def fail_futures(futures, msg):
+    for fut in futures:
+        if not fut.done():
+            fut.set_exception(DispatchError(msg))
+
+
+def workers_overloaded():
+    '''
+    True if workers are known, none of them is healthy and at least one reported overload (DEGRADED).
+    New work is then declined instead of queued behind a backlog the workers cannot catch up with.
+    '''
+    statuses = [WorkerState.worker_health.get(ip, StatusCode.STATUS_UNAVAILABLE) for ip in WorkerState.worker_ips]
+    return (StatusCode.STATUS_DEGRADED in statuses
+            and StatusCode.STATUS_OK not in statuses)
 
 
-def pick_worker():
+async def acquire_worker(expires_at=math.inf, exclude=()):
     '''
-    Pick a worker in round robin fashion, preferring healthy workers.
+    Wait for a worker with a free credit, see pick_worker. Raises RuntimeError if there is no worker
+    and asyncio.TimeoutError if none had a free credit before expires_at.
+    '''
+    loop = asyncio.get_event_loop()
+    while True:
+        worker_ip = pick_worker(exclude)
+        if worker_ip is not None:
+            return worker_ip
+        remaining = expires_at - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("No worker credit before the client deadline")
+        # Also wake up now and then, health changes can make workers available without a returned credit
+        await worker_credits.wait(timeout=min(remaining, 1))
+
+
+def pick_worker(exclude=(), overcommit=False):
+    '''
+    Pick a worker with a free credit with the configured selection policy, preferring healthy workers,
+    and take its credit. Degraded workers are only used when no worker is healthy, and workers ejected
+    by their circuit breaker only when all are. Workers in exclude are not picked. Returns None if no
+    worker has a free credit.
+    With overcommit, workers without a free credit are picked too. Hedges use it, they are limited
+    by the hedge budget, and a slow batch has usually shrunk the windows when a hedge is due.
     '''
     if not WorkerState.worker_ips:
         raise RuntimeError("No workers available")
-    second_choice = None
-    for _ in range(len(WorkerState.worker_ips)):
-        WorkerState.worker_index = (
-            WorkerState.worker_index + 1) % len(WorkerState.worker_ips)
-        worker_ip = WorkerState.worker_ips[WorkerState.worker_index]
+    healthy, degraded = [], []
+    for worker_ip in WorkerState.worker_ips:
+        if worker_ip in exclude:
+            continue
         worker_health = WorkerState.worker_health.get(worker_ip, StatusCode.STATUS_UNAVAILABLE)
         if worker_health == StatusCode.STATUS_OK:
-            return worker_ip
+            healthy.append(worker_ip)
         elif worker_health == StatusCode.STATUS_DEGRADED:
-            second_choice = worker_ip
-    if second_choice:
-        return second_choice
-    else: raise RuntimeError("No worker available")
+            degraded.append(worker_ip)
+    candidates = healthy or degraded
+    if not candidates:
+        raise RuntimeError("No worker available")
+    candidates = [ip for ip in candidates if circuit_breakers.allows(ip)] or candidates
+    if not overcommit:
+        candidates = [ip for ip in candidates if worker_credits.available(ip)]
+        if not candidates:
+            return None
+    worker_ip = worker_policy.select(candidates)
+    worker_credits.acquire(worker_ip)
+    circuit_breakers.dispatched(worker_ip)
+    return worker_ip
+
+
+def release_worker(worker_ip):
+    '''
+    Give back a worker taken with pick_worker that is not called after all.
+    '''
+    worker_credits.release(worker_ip)
+    circuit_breakers.record(worker_ip, None)
 
 
 async def queue_metrics_loop():
@@ -316,25 +834,73 @@ async def queue_metrics_loop():
         await asyncio.sleep(2)
 
 
-async def serve():
-    # Start Prometheus metrics server
-    start_http_server(8000)  # Expose metrics on port 8000
+async def serve(metrics_server=True):
+    # Start Prometheus metrics server, a multi-process coordinator serves the metrics from its supervisor
+    if metrics_server:
+        start_http_server(METRICS_PORT)  # Expose metrics on port 8000
     asyncio.create_task(queue_metrics_loop())
 
     # Start background coroutines
     asyncio.create_task(resolve_worker_loop())
-    asyncio.create_task(health_check_loop())
+    asyncio.create_task(status_watch_loop())
     asyncio.create_task(batching_loop())
 
-    server = aio.server()
+    # SO_REUSEPORT lets the processes of a multi-process coordinator listen on the same port
+    server = aio.server(options=[("grpc.so_reuseport", 1)])
     add_TextEmbeddingServicer_to_server(
         TextEmbeddingServicerImpl(), server)
     server.add_insecure_port(f"0.0.0.0:{COORDINATOR_PORT}")
     await server.start()
-    logging.info(f"Coordinator gRPC server started on port {COORDINATOR_PORT}")
+    logging.info(f"Coordinator gRPC server started on port {COORDINATOR_PORT}" +
+                 (f" (process {PROCESS_INDEX})" if PROCESS_INDEX is not None else ""))
 
     await server.wait_for_termination()
 
 
+def run_processes(count):
+    """
+    Run count coordinator processes that listen on the same port with SO_REUSEPORT, the kernel spreads
+    client connections across them. Each process has its own queue, batcher, worker channels and cache,
+    so the request handling, batching and response assembly of the coordinator scale with the cores.
+    Metrics are aggregated across the processes with the prometheus_client multiprocess mode and
+    served by this supervisor process, which restarts server processes that exit.
+    """
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="coordinator_metrics_")
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        # Files left from a previous run would be added to the new counters
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=metrics_dir)
+    start_http_server(METRICS_PORT, registry=registry)
+
+    def start(index):
+        env = dict(os.environ, COORDINATOR_PROCESS_INDEX=str(index), PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    # Stop the server processes with the supervisor, e.g. on docker stop
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    processes = [start(index) for index in range(count)]
+    logging.info(f"Started {count} coordinator processes on port {COORDINATOR_PORT}")
+    try:
+        while True:
+            time.sleep(1)
+            for index, process in enumerate(processes):
+                if process.poll() is not None:
+                    logging.error(f"Coordinator process {index} exited with code {process.returncode}, restarting it.")
+                    multiprocess.mark_process_dead(process.pid, metrics_dir)
+                    processes[index] = start(index)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+            multiprocess.mark_process_dead(process.pid, metrics_dir)
+
+
 if __name__ == "__main__":
-    asyncio.run(serve())
+    if COORDINATOR_PROCESSES > 1 and PROCESS_INDEX is None:
+        run_processes(COORDINATOR_PROCESSES)
+    else:
+        asyncio.run(serve(metrics_server=PROCESS_INDEX is None))
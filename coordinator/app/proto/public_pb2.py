@@ -24,21 +24,27 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12proto/public.proto\x12\x0etext_embedding\"\x1d\n\x0c\x45mbedRequest\x12\r\n\x05texts\x18\x01 \x03(\t\"\x89\x01\n\rEmbedResponse\x12(\n\x04\x63ode\x18\x01 \x01(\x0e\x32\x1a.text_embedding.ReturnCode\x12\x12\n\nreturn_msg\x18\x02 \x01(\t\x12\x0b\n\x03ids\x18\x03 \x03(\t\x12-\n\nembeddings\x18\x04 \x03(\x0b\x32\x19.text_embedding.Embedding\"\x1b\n\tEmbedding\x12\x0e\n\x06vector\x18\x01 \x03(\x02*\x1f\n\nReturnCode\x12\x06\n\x02OK\x10\x00\x12\t\n\x05\x45RROR\x10\x01\x32U\n\rTextEmbedding\x12\x44\n\x05\x45mbed\x12\x1c.text_embedding.EmbedRequest\x1a\x1d.text_embedding.EmbedResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12proto/public.proto\x12\x0etext_embedding\"}\n\x0c\x45mbedRequest\x12\r\n\x05texts\x18\x01 \x03(\t\x12\x0e\n\x06packed\x18\x02 \x01(\x08\x12\x12\n\nrequest_id\x18\x03 \x01(\t\x12*\n\x08priority\x18\x04 \x01(\x0e\x32\x18.text_embedding.Priority\x12\x0e\n\x06tenant\x18\x05 \x01(\t\"\x85\x02\n\rEmbedResponse\x12(\n\x04\x63ode\x18\x01 \x01(\x0e\x32\x1a.text_embedding.ReturnCode\x12\x12\n\nreturn_msg\x18\x02 \x01(\t\x12\x0b\n\x03ids\x18\x03 \x03(\t\x12-\n\nembeddings\x18\x04 \x03(\x0b\x32\x19.text_embedding.Embedding\x12;\n\x11packed_embeddings\x18\x05 \x01(\x0b\x32 .text_embedding.PackedEmbeddings\x12\x12\n\nrequest_id\x18\x06 \x01(\t\x12)\n\x06\x65rrors\x18\x07 \x03(\x0b\x32\x19.text_embedding.TextError\"+\n\tTextError\x12\r\n\x05index\x18\x01 \x01(\r\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x1b\n\tEmbedding\x12\x0e\n\x06vector\x18\x01 \x03(\x02\"/\n\x10PackedEmbeddings\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\r\n\x05shape\x18\x02 \x03(\r*2\n\x08Priority\x12\x13\n\x0fPRIORITY_ONLINE\x10\x00\x12\x11\n\rPRIORITY_BULK\x10\x01*,\n\nReturnCode\x12\x06\n\x02OK\x10\x00\x12\t\n\x05\x45RROR\x10\x01\x12\x0b\n\x07PARTIAL\x10\x02\x32\xa5\x01\n\rTextEmbedding\x12\x44\n\x05\x45mbed\x12\x1c.text_embedding.EmbedRequest\x1a\x1d.text_embedding.EmbedResponse\x12N\n\x0b\x45mbedStream\x12\x1c.text_embedding.EmbedRequest\x1a\x1d.text_embedding.EmbedResponse(\x01\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'proto.public_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_RETURNCODE']._serialized_start=238
-  _globals['_RETURNCODE']._serialized_end=269
+  _globals['_PRIORITY']._serialized_start=552
+  _globals['_PRIORITY']._serialized_end=602
+  _globals['_RETURNCODE']._serialized_start=604
+  _globals['_RETURNCODE']._serialized_end=648
   _globals['_EMBEDREQUEST']._serialized_start=38
-  _globals['_EMBEDREQUEST']._serialized_end=67
-  _globals['_EMBEDRESPONSE']._serialized_start=70
-  _globals['_EMBEDRESPONSE']._serialized_end=207
-  _globals['_EMBEDDING']._serialized_start=209
-  _globals['_EMBEDDING']._serialized_end=236
-  _globals['_TEXTEMBEDDING']._serialized_start=271
-  _globals['_TEXTEMBEDDING']._serialized_end=356
+  _globals['_EMBEDREQUEST']._serialized_end=163
+  _globals['_EMBEDRESPONSE']._serialized_start=166
+  _globals['_EMBEDRESPONSE']._serialized_end=427
+  _globals['_TEXTERROR']._serialized_start=429
+  _globals['_TEXTERROR']._serialized_end=472
+  _globals['_EMBEDDING']._serialized_start=474
+  _globals['_EMBEDDING']._serialized_end=501
+  _globals['_PACKEDEMBEDDINGS']._serialized_start=503
+  _globals['_PACKEDEMBEDDINGS']._serialized_end=550
+  _globals['_TEXTEMBEDDING']._serialized_start=651
+  _globals['_TEXTEMBEDDING']._serialized_end=816
 # @@protoc_insertion_point(module_scope)
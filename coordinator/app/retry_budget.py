@@ -0,0 +1,46 @@
+import time
+
+from prometheus_client import Counter
+
+retry_count = Counter('coordinator_retry_count', 'Number of batch retries, including the halves of split batches')
+retry_budget_exhausted_count = Counter('coordinator_retry_budget_exhausted_count',
+                                       'Number of batches failed without retry because the retry budget was used up')
+
+
+class RetryBudget:
+    '''
+    Token bucket that limits retries to a fraction of the recent traffic.
+
+    Every dispatched batch deposits ratio tokens and every retry takes one, so retries add at most
+    that fraction of load, also in a brownout where most batches fail. The bucket holds at most
+    max_tokens and starts full. It also refills by min_per_second, so sporadic failures at low
+    traffic can still be retried.
+    '''
+
+    def __init__(self, ratio=0.2, max_tokens=20, min_per_second=1.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.min_per_second = min_per_second
+        self._tokens = float(max_tokens)
+        self._refilled = time.monotonic()
+
+    def dispatched(self):
+        self._deposit(self.ratio)
+
+    def try_acquire(self):
+        '''
+        Take one retry from the budget. Returns False if the budget is used up.
+        '''
+        self._deposit(0)
+        if self._tokens < 1:
+            retry_budget_exhausted_count.inc()
+            return False
+        self._tokens -= 1
+        retry_count.inc()
+        return True
+
+    def _deposit(self, tokens):
+        now = time.monotonic()
+        tokens += (now - self._refilled) * self.min_per_second
+        self._refilled = now
+        self._tokens = min(self.max_tokens, self._tokens + tokens)
@@ -1,26 +1,52 @@
-import asyncio
-
-
-class DynIncAsyncSemaphore:
-    def __init__(self, threshold: int):
-        self._threshold = threshold
-        self._counter = 0
-        self._cond = asyncio.Condition()
-
-    async def acquire(self):
-        async with self._cond:
-            while self._counter >= self._threshold:
-                await self._cond.wait()
-            self._counter += 1
-
-    async def release(self):
-        async with self._cond:
-            self._counter -= 1
-            self._counter = max(self._counter, 0)
-            self._cond.notify_all()
-
-    async def update_threshold(self, value: int):
-        async with self._cond:
-            self._threshold = value
-            if self._cond._waiters:
-                self._cond.notify_all()
+import sys
+from array import array
+
+from proto.public_pb2 import Embedding, PackedEmbeddings
+
+
+def embedding_rows(worker_response):
+    '''
+    Split the embeddings of a worker response into one little-endian float32 bytes row per text,
+    regardless of whether the worker sent them packed or as float lists.
+    '''
+    packed = worker_response.packed_embeddings
+    if packed.shape:
+        rows, dim = packed.shape
+        size = dim * 4
+        data = packed.data
+        if len(data) != rows * size:
+            raise ValueError(f"Packed embeddings of {len(data)} bytes do not match shape {list(packed.shape)}.")
+        return [data[i * size:(i + 1) * size] for i in range(rows)]
+    return [_swap_byte_order(array("f", emb.vector)).tobytes() for emb in worker_response.embeddings]
+
+
+def pack_rows(rows):
+    '''
+    Join bytes rows into a PackedEmbeddings message. None rows (failed texts) are filled with zeros.
+    '''
+    size = next((len(row) for row in rows if row is not None), 0)
+    data = b"".join(row if row is not None else bytes(size) for row in rows)
+    return PackedEmbeddings(data=data, shape=[len(rows), size // 4])
+
+
+def unpack_rows(rows):
+    '''
+    Convert bytes rows into Embedding messages for clients that did not opt in to the packed format.
+    None rows (failed texts) give empty embeddings.
+    '''
+    embeddings = []
+    for row in rows:
+        if row is None:
+            embeddings.append(Embedding())
+            continue
+        vector = array("f")
+        vector.frombytes(row)
+        embeddings.append(Embedding(vector=_swap_byte_order(vector)))
+    return embeddings
+
+
+def _swap_byte_order(vector):
+    # array uses the native byte order, the wire format is little-endian. Swapping is its own inverse.
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return vector
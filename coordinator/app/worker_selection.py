@@ -0,0 +1,151 @@
+import random
+
+
+class WorkerLoad:
+    '''
+    Load observed by the coordinator for one worker: batches currently outstanding and an
+    exponentially weighted moving average of its dispatch latency. Completed by the capacity and
+    latency the worker reports in its heartbeats.
+    '''
+
+    def __init__(self):
+        self.outstanding = 0
+        self.latency_ewma = None  # ms, None until the first batch completed
+        self.capacity = 1  # Batches the worker processes concurrently
+        self.reported_latency = None  # ms, p50 reported by the worker
+
+    @property
+    def utilization(self):
+        return self.outstanding / self.capacity
+
+
+class WorkerLoadTracker:
+    '''
+    Tracks outstanding batches and dispatch latencies per worker, fed by the dispatch path.
+    '''
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._loads = {}
+
+    def get(self, worker_ip):
+        load = self._loads.get(worker_ip)
+        if load is None:
+            load = self._loads[worker_ip] = WorkerLoad()
+        return load
+
+    def start(self, worker_ip):
+        self.get(worker_ip).outstanding += 1
+
+    def finish(self, worker_ip, latency):
+        '''
+        Record the end of a dispatch. Failed dispatches are recorded too, a worker that times out
+        is as bad as a slow one.
+        '''
+        load = self.get(worker_ip)
+        load.outstanding = max(0, load.outstanding - 1)
+        if load.latency_ewma is None:
+            load.latency_ewma = latency
+        else:
+            load.latency_ewma += self.alpha * (latency - load.latency_ewma)
+
+    def report(self, worker_ip, capacity, latency):
+        '''
+        Record the capacity and p50 latency (ms, 0 if unknown) reported in a worker heartbeat.
+        '''
+        load = self.get(worker_ip)
+        load.capacity = max(1, capacity)
+        load.reported_latency = latency or None
+
+    def forget(self, worker_ips):
+        '''
+        Drop the state of all workers not in worker_ips.
+        '''
+        for worker_ip in list(self._loads):
+            if worker_ip not in worker_ips:
+                del self._loads[worker_ip]
+
+    def mean_latency(self):
+        '''
+        Mean latency EWMA over all workers with measurements, in ms, or None.
+        '''
+        known = [l.latency_ewma for l in self._loads.values() if l.latency_ewma is not None]
+        return sum(known) / len(known) if known else None
+
+    def cost(self, worker_ip):
+        '''
+        Expected time until a new batch on this worker completes: its latency times the batches it
+        would be working on per unit of capacity. Workers without measurements get their reported latency
+        or the mean latency of the others, so they are tried without being flooded.
+        '''
+        load = self.get(worker_ip)
+        latency = load.latency_ewma or load.reported_latency or self.mean_latency() or 1.0
+        return (load.utilization + 1) * latency
+
+
+class RoundRobinPolicy:
+    '''
+    Rotate through the workers, ignoring their load.
+    '''
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self._index = 0
+
+    def select(self, candidates):
+        self._index = (self._index + 1) % len(candidates)
+        return candidates[self._index]
+
+
+class LeastOutstandingPolicy:
+    '''
+    Pick the worker with the fewest outstanding batches per unit of capacity, ties are broken randomly.
+    '''
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def select(self, candidates):
+        fewest = min(self.tracker.get(ip).utilization for ip in candidates)
+        return random.choice([ip for ip in candidates if self.tracker.get(ip).utilization == fewest])
+
+
+class EwmaLatencyPolicy:
+    '''
+    Pick the worker with the lowest latency-weighted load, see WorkerLoadTracker.cost.
+    '''
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def select(self, candidates):
+        return min(random.sample(candidates, len(candidates)), key=self.tracker.cost)
+
+
+class PowerOfTwoPolicy:
+    '''
+    Sample two workers at random and pick the one with the lower latency-weighted load.
+    Nearly as good as comparing all workers, but never sends a burst of batches to the same one.
+    '''
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def select(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        return min(random.sample(candidates, 2), key=self.tracker.cost)
+
+
+POLICIES = {
+    "round_robin": RoundRobinPolicy,
+    "least_outstanding": LeastOutstandingPolicy,
+    "ewma": EwmaLatencyPolicy,
+    "p2c": PowerOfTwoPolicy,
+}
+
+
+def create_policy(name, tracker):
+    if name not in POLICIES:
+        raise ValueError(f"Unknown worker selection policy {name!r}, expected one of {sorted(POLICIES)}.")
+    return POLICIES[name](tracker)
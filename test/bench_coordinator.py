@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import grpc
+import numpy as np
+from proto.public_pb2 import EmbedRequest, ReturnCode
+from proto.public_pb2_grpc import TextEmbeddingStub
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+
+async def client(args, run_id):
+    '''
+    Closed-loop load: every channel keeps args.concurrency requests outstanding until the duration is over.
+    Texts are unique, so every text is batched and sent to a worker instead of served from the cache.
+    Returns the number of embedded texts, the request latencies and the number of failed requests.
+    '''
+    latencies, failed, texts_done = [], 0, 0
+    deadline = time.monotonic() + args.duration
+    counter = 0
+
+    async def loop(stub):
+        nonlocal failed, texts_done, counter
+        while time.monotonic() < deadline:
+            counter += 1
+            texts = [f"{run_id} {counter} {i} " + "lorem ipsum " * args.text_words for i in range(args.batch_size)]
+            start = time.monotonic()
+            try:
+                resp = await stub.Embed(EmbedRequest(texts=texts, packed=True), timeout=args.timeout)
+                if resp.code != ReturnCode.OK:
+                    failed += 1
+                    continue
+                latencies.append(time.monotonic() - start)
+                texts_done += len(texts)
+            except grpc.aio.AioRpcError:
+                failed += 1
+
+    # One channel is one HTTP/2 connection, which SO_REUSEPORT assigns to a single coordinator process
+    channels = [grpc.aio.insecure_channel(args.coordinator_addr, options=[("grpc.use_local_subchannel_pool", 1)])
+                for _ in range(args.channels)]
+    try:
+        await asyncio.gather(*(loop(TextEmbeddingStub(channel)) for channel in channels for _ in range(args.concurrency)))
+    finally:
+        for channel in channels:
+            await channel.close()
+    return texts_done, latencies, failed
+
+
+def client_process(args, run_id, results):
+    results.put(asyncio.run(client(args, run_id)))
+
+
+def run_load(args):
+    '''
+    Run the load from args.client_processes processes, so the client does not become the bottleneck.
+    '''
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client_process, args=(args, f"{uuid.uuid4().hex[:8]}-{i}", results))
+                 for i in range(args.client_processes)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    texts = sum(texts_done for texts_done, _, _ in outcomes)
+    latencies = [latency for _, process_latencies, _ in outcomes for latency in process_latencies]
+    failed = sum(process_failed for _, _, process_failed in outcomes)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (0.0, 0.0)
+    return texts / args.duration, p50, p99, failed
+
+
+def wait_for_port(addr, timeout=30):
+    host, port = addr.rsplit(":", 1)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, int(port)), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Coordinator did not come up on {addr}")
+
+
+def main(args):
+    if not args.processes:
+        rate, p50, p99, failed = run_load(args)
+        logging.info(f"{rate:.0f} texts/sec, p50 {p50:.1f}ms, p99 {p99:.1f}ms, failed requests: {failed}")
+        return
+    # Start the coordinator with every process count in turn and measure each
+    results = []
+    for count in args.processes:
+        env = dict(os.environ, COORDINATOR_PROCESSES=str(count), COORDINATOR_CACHE_MAX_BYTES="0")
+        coordinator = subprocess.Popen([sys.executable, args.coordinator_path], env=env, cwd=os.path.dirname(args.coordinator_path),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.coordinator_addr)
+            time.sleep(args.warmup)  # Let the coordinator processes discover the workers
+            results.append((count, *run_load(args)))
+        finally:
+            coordinator.terminate()
+            coordinator.wait()
+        logging.info(f"{count} processes: {results[-1][1]:.0f} texts/sec")
+    base = results[0][1] or 1
+    print(f"{'processes':>9} {'texts/sec':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for count, rate, p50, p99, failed in results:
+        print(f"{count:>9} {rate:>10.0f} {rate / base:>7.2f}x {p50:>8.1f} {p99:>8.1f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure coordinator throughput, optionally for several coordinator process counts.")
+    parser.add_argument('-d', '--duration', type=int, default=10, help='Load duration in seconds per measurement (default: 10)')
+    parser.add_argument('--batch-size', type=int, default=8, help='Texts per request (default: 8)')
+    parser.add_argument('--text-words', type=int, default=4, help='Repetitions of filler words per text (default: 4)')
+    parser.add_argument('--channels', type=int, default=8, help='gRPC channels (connections) per client process (default: 8)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Outstanding requests per channel (default: 8)')
+    parser.add_argument('--client-processes', type=int, default=2, help='Load generating processes (default: 2)')
+    parser.add_argument('--timeout', type=int, default=10, help='Request timeout in seconds (default: 10)')
+    parser.add_argument('--coordinator-addr', type=str, default="localhost:50050", help='Coordinator gRPC address (default: localhost:50050)')
+    parser.add_argument('--processes', type=lambda value: [int(n) for n in value.split(",")],
+                        help='Comma-separated coordinator process counts, e.g. 1,2,4. Starts a local coordinator for each '
+                             '(default: benchmark the running coordinator)')
+    parser.add_argument('--coordinator-path', type=str, default=os.path.abspath("../coordinator/app/main.py"),
+                        help='Coordinator started for --processes (default: ../coordinator/app/main.py)')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds between coordinator start and load with --processes (default: 3)')
+    args = parser.parse_args()
+    main(args)
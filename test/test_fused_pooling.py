@@ -0,0 +1,55 @@
+'''
+Parity check of a fused model (see worker/app/fuse_pooling.py) against the NumPy pooling path of its base model.
+Runs the worker code, with the worker dependencies, e.g. `uv run --project ../worker test_fused_pooling.py`.
+Exits with an error if any embedding deviates more than the tolerance.
+'''
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+WORKER_APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worker", "app")
+sys.path.insert(0, WORKER_APP_DIR)
+from main import MODEL_PATHS, create_session, embed, fused_model_path
+
+
+def main(args):
+    # The worker loads its model and tokenizer from paths relative to its app directory
+    validation_data_path = os.path.abspath(args.validation_data_path)
+    model = os.path.abspath(args.model) if args.model else MODEL_PATHS["fp32"]
+    fused_model = os.path.abspath(args.fused_model) if args.fused_model else fused_model_path(model)
+    os.chdir(WORKER_APP_DIR)
+    with open(validation_data_path, "r", encoding="utf-8") as f:
+        texts = [json.loads(line)["text"] for line in f if line.strip()]
+    # Mix lengths within a batch, so padded positions have to be masked out correctly
+    texts += [" ".join(texts[:n]) for n in (2, 5, 20)]
+
+    base = create_session(model)
+    fused = create_session(fused_model)
+    max_diff = 0.0
+    for i in range(0, len(texts), args.batch_size):
+        batch = texts[i:i + args.batch_size]
+        expected = embed(batch, base)
+        actual = embed(batch, fused)
+        if actual.shape != expected.shape:
+            print(f"FAIL: fused model returned shape {actual.shape}, expected {expected.shape}")
+            sys.exit(1)
+        max_diff = max(max_diff, float(np.abs(actual - expected).max()))
+    print(f"Texts: {len(texts)}, max abs difference: {max_diff:.2e}, tolerance: {args.tolerance:.0e}")
+    if max_diff > args.tolerance:
+        print("FAIL: fused model deviates from the NumPy path")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that a fused model matches the NumPy pooling path.")
+    parser.add_argument('--model', type=str, help=f'Base model (default: {MODEL_PATHS["fp32"]} in worker/app)')
+    parser.add_argument('--fused-model', type=str, help='Fused model (default: the base model path with .pooled.onnx)')
+    parser.add_argument('--validation-data-path', type=str, default="validation_data.jsonl", help='Path to validation data (default: validation_data.jsonl)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Texts per model run (default: 16)')
+    parser.add_argument('--tolerance', type=float, default=1e-5, help='Max allowed absolute difference per value (default: 1e-5)')
+    args = parser.parse_args()
+    main(args)
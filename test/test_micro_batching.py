@@ -0,0 +1,65 @@
+'''
+Check that a failed merged model run of the worker's MicroBatcher only fails the request that caused it.
+Runs against a fake model, with the worker dependencies, e.g. `uv run --project ../worker test_micro_batching.py`.
+Exits with an error if a request merged with a rejected one fails too.
+'''
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worker", "app"))
+from micro_batching import MicroBatcher
+
+
+class FakeModel:
+    '''
+    Embeds a text as its upper case version and rejects every run that contains the poison text.
+    '''
+
+    def __init__(self, poison, delay):
+        self.poison = poison
+        self.delay = delay
+        self.runs = []
+
+    async def run_batch(self, texts):
+        self.runs.append(list(texts))
+        await asyncio.sleep(self.delay)
+        if self.poison in texts:
+            raise ValueError(f"Model rejected {self.poison!r}")
+        return [text.upper() for text in texts]
+
+
+async def main(args):
+    model = FakeModel("poison", args.delay)
+    # One run slot: the blocker's run occupies it, so the requests behind it are merged into the next run
+    batcher = MicroBatcher(model.run_batch, 1, max_texts=64, max_tokens=16384, max_wait=args.delay / 5)
+    blocker = asyncio.create_task(batcher.submit(["blocker"]))
+    await asyncio.sleep(args.delay / 2)
+    requests = [["a"], ["poison"], ["b", "c"]]
+    results = await asyncio.gather(*(batcher.submit(texts) for texts in requests), return_exceptions=True)
+    await blocker
+
+    ok = True
+    if not any(len(run) > 1 and "poison" in run for run in model.runs):
+        print(f"FAIL: requests were not merged, model runs: {model.runs}")
+        ok = False
+    for texts, result in zip(requests, results):
+        expected_error = "poison" in texts
+        if expected_error and not isinstance(result, ValueError):
+            print(f"FAIL: {texts} should fail, got {result!r}")
+            ok = False
+        elif not expected_error and result != [text.upper() for text in texts]:
+            print(f"FAIL: {texts} merged with a rejected request, got {result!r}")
+            ok = False
+    print(f"Model runs: {model.runs}")
+    if not ok:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that a rejected request does not fail the requests merged with it.")
+    parser.add_argument('--delay', type=float, default=0.05, help='Fake model run time in seconds (default: 0.05)')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import logging
+import sys
+import urllib.request
+import uuid
+
+import grpc
+from proto.public_pb2 import EmbedRequest, ReturnCode
+from proto.public_pb2_grpc import TextEmbeddingStub
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+
+def read_metrics(metrics_url):
+    '''
+    Fetch the coordinator metrics and return them as {(name, labels): value}.
+    '''
+    metrics = {}
+    with urllib.request.urlopen(metrics_url, timeout=5) as resp:
+        for line in resp.read().decode().splitlines():
+            if not line or line.startswith("#"):
+                continue
+            name, value = line.rsplit(" ", 1)
+            metric, _, labels = name.partition("{")
+            metrics[(metric, labels.rstrip("}"))] = float(value)
+    return metrics
+
+
+def metric_sum(metrics, name):
+    return sum(value for (metric, _), value in metrics.items() if metric == name)
+
+
+async def send(stub, batch_size, timeout):
+    texts = [f"{uuid.uuid4().hex} short deadline test" for _ in range(batch_size)]
+    try:
+        resp = await stub.Embed(EmbedRequest(texts=texts), timeout=timeout)
+        return resp.code == ReturnCode.OK
+    except grpc.aio.AioRpcError:
+        return False
+
+
+async def main(args):
+    '''
+    Send requests with deadlines shorter than the worker latency against healthy workers. The calls cut
+    short by the client deadline must not eject workers, shrink their credit windows or be retried,
+    after them requests with a normal deadline must all succeed.
+    '''
+    before = read_metrics(args.metrics_url)
+    async with grpc.aio.insecure_channel(args.coordinator_addr) as channel:
+        stub = TextEmbeddingStub(channel)
+        for _ in range(args.rounds):
+            # Spaced out, so most requests are dispatched as a worker call of their own
+            tasks = []
+            for _ in range(args.requests):
+                tasks.append(asyncio.create_task(send(stub, args.batch_size, args.deadline_ms / 1000)))
+                await asyncio.sleep(args.interval_ms / 1000)
+            results = await asyncio.gather(*tasks)
+            logging.info(f"Short deadline round: {sum(results)}/{len(results)} requests completed in time")
+            await asyncio.sleep(0.1)
+        results = await asyncio.gather(*(send(stub, args.batch_size, args.timeout) for _ in range(args.requests)))
+    after = read_metrics(args.metrics_url)
+    ok = True
+    ejections = (metric_sum(after, "coordinator_worker_ejection_count_total")
+                 - metric_sum(before, "coordinator_worker_ejection_count_total"))
+    if ejections:
+        logging.error(f"{ejections:.0f} workers were ejected by short client deadlines")
+        ok = False
+    retries = sum(metric_sum(after, name) - metric_sum(before, name)
+                  for name in ("coordinator_retry_count_total", "coordinator_split_batch_count_total"))
+    if retries:
+        logging.error(f"{retries:.0f} retries or splits of batches whose client deadline had passed")
+        ok = False
+    open_breakers = [labels for (metric, labels), value in after.items()
+                     if metric == "coordinator_worker_breaker_state" and value != 0]
+    if open_breakers:
+        logging.error(f"Breakers not closed after short deadline requests: {open_breakers}")
+        ok = False
+    # Compared to the windows before the test, earlier traffic may have sized them already
+    shrunk_windows = [labels for (metric, labels), value in after.items()
+                      if metric == "coordinator_worker_credit_window"
+                      and value < before.get((metric, labels), args.min_window)]
+    if shrunk_windows:
+        logging.error(f"Credit windows shrunk by short deadline requests: {shrunk_windows}")
+        ok = False
+    if not all(results):
+        logging.error(f"{len(results) - sum(results)}/{len(results)} requests with a normal deadline failed")
+        ok = False
+    logging.info("Short deadline test passed." if ok else "Short deadline test failed.")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that short client deadlines do not penalize healthy workers.")
+    parser.add_argument('--rounds', type=int, default=5, help='Rounds of short deadline requests (default: 5)')
+    parser.add_argument('--requests', type=int, default=40, help='Requests per round (default: 40)')
+    parser.add_argument('--batch-size', type=int, default=8, help='Texts per request (default: 8)')
+    parser.add_argument('--deadline-ms', type=int, default=20, help='Client deadline of the short requests in ms (default: 20)')
+    parser.add_argument('--interval-ms', type=int, default=10, help='Interval between the short deadline requests in ms (default: 10)')
+    parser.add_argument('--timeout', type=int, default=10, help='Client deadline of the normal requests in seconds (default: 10)')
+    parser.add_argument('--min-window', type=int, default=4, help='Expected credit window of workers without one before the test, the initial window (default: 4)')
+    parser.add_argument('--coordinator-addr', type=str, default="localhost:50050", help='Coordinator gRPC address (default: localhost:50050)')
+    parser.add_argument('--metrics-url', type=str, default="http://localhost:8000", help='Coordinator metrics URL (default: http://localhost:8000)')
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import grpc
+from proto.public_pb2 import EmbedRequest
+from proto.public_pb2_grpc import TextEmbeddingStub
+from traffic_generator import decode_embeddings, embeddings_match
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+
+async def main(args):
+    with open(args.validation_data_path, "r", encoding="utf-8") as f:
+        data = [json.loads(line) for line in f if line.strip()]
+    expected = {}
+
+    async def requests():
+        # Generator is consumed by gRPC as fast as flow control allows
+        for n in range(args.requests):
+            idx = (n * args.batch_size) % len(data)
+            records = [data[(idx + i) % len(data)] for i in range(args.batch_size)]
+            request_id = str(n)
+            expected[request_id] = records
+            yield EmbedRequest(texts=[r["text"] for r in records], packed=args.packed, request_id=request_id)
+
+    success_count = 0
+    failed_count = 0
+    start = time.time()
+    async with grpc.aio.insecure_channel(args.coordinator_addr) as channel:
+        stub = TextEmbeddingStub(channel)
+        logging.info(f"Streaming {args.requests} requests of {args.batch_size} texts.")
+        async for resp in stub.EmbedStream(requests(), timeout=args.timeout):
+            records = expected.pop(resp.request_id)
+            embeddings = decode_embeddings(resp)
+            if resp.code == 0 and len(embeddings) == len(records) and all(
+                    embeddings_match(r["embedding"], emb) for r, emb in zip(records, embeddings)):
+                success_count += 1
+            else:
+                failed_count += 1
+                logging.error(f"Request {resp.request_id} failed: code={resp.code} return_msg={resp.return_msg}")
+    elapsed = time.time() - start
+    logging.info(f"Stream complete: {success_count} succeeded, {failed_count} failed, {len(expected)} unanswered "
+                 f"in {elapsed:.2f}s ({success_count * args.batch_size / elapsed:.1f} texts/sec).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Push requests over the streaming EmbedStream API and validate the responses.")
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='Number of requests to stream (default: 1000)')
+    parser.add_argument('--batch-size', type=int, default=10, help='Texts per request (default: 10)')
+    parser.add_argument('--timeout', type=int, default=120, help='Stream timeout in seconds (default: 120)')
+    parser.add_argument('--packed', action='store_true', help='Request embeddings as packed float32 buffers (default: off)')
+    parser.add_argument('--validation-data-path', type=str, default="validation_data.jsonl", help='Path to validation data (default: validation_data.jsonl)')
+    parser.add_argument('--coordinator-addr', type=str, default="localhost:50050", help='Coordinator gRPC address (default: localhost:50050)')
+    args = parser.parse_args()
+    asyncio.run(main(args))
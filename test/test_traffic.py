@@ -13,7 +13,8 @@ async def main(args):
         rate_noise_std=args.rate_noise_std,
         timeout=args.timeout,
         validation_data_path=args.validation_data_path,
-        coordinator_addr=args.coordinator_addr
+        coordinator_addr=args.coordinator_addr,
+        packed=args.packed
     )
     logging.info("Starting traffic generation test.")
     await generator.start()
@@ -31,5 +32,6 @@ if __name__ == "__main__":
     parser.add_argument('--timeout', type=int, default=10, help='Request timeout in seconds (default: 10)')
     parser.add_argument('--validation-data-path', type=str, default="validation_data.jsonl", help='Path to validation data (default: validation_data.jsonl)')
     parser.add_argument('--coordinator-addr', type=str, default="localhost:50050", help='Coordinator gRPC address (default: localhost:50050)')
+    parser.add_argument('--packed', action='store_true', help='Request embeddings as packed float32 buffers (default: off)')
     args = parser.parse_args()
     asyncio.run(main(args))
@@ -5,6 +5,7 @@ import time
 import logging
 import math
 import random
+import numpy as np
 from proto.public_pb2 import EmbedRequest
 from proto.public_pb2_grpc import TextEmbeddingStub
 
@@ -15,6 +16,12 @@ def embeddings_match(ref_emb, test_emb, tolerance=1e-10):
         return False
     return all(math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance) for a, b in zip(ref_emb, test_emb))
 
+def decode_embeddings(resp):
+    # Packed embeddings are decoded zero-copy into a (rows, dim) float32 array
+    if resp.packed_embeddings.shape:
+        return np.frombuffer(resp.packed_embeddings.data, dtype="<f4").reshape(tuple(resp.packed_embeddings.shape))
+    return [list(emb_msg.vector) for emb_msg in resp.embeddings]
+
 class TrafficGenerator:
     def __init__(self,
                  batch_size=5,
@@ -23,7 +30,8 @@ class TrafficGenerator:
                  rate_noise_std=0.2,
                  timeout=10,
                  validation_data_path="validation_data.jsonl",
-                 coordinator_addr="localhost:50050"):
+                 coordinator_addr="localhost:50050",
+                 packed=False):
         self.batch_size = batch_size
         self.rate_mean = rate_mean
         self.rate_noise_time_constant = rate_noise_time_constant
@@ -31,6 +39,7 @@ class TrafficGenerator:
         self.rate_noise_std = rate_noise_std
         self.validation_data_path = validation_data_path
         self.coordinator_addr = coordinator_addr
+        self.packed = packed
         self._task = None
         self._cancel_event = asyncio.Event()
 
@@ -71,17 +80,18 @@ class TrafficGenerator:
                 batch = [data[(idx + i) % len(data)]["text"] for i in range(self.batch_size)]
                 batch_embeddings = [data[(idx + i) % len(data)]["embedding"] for i in range(self.batch_size)]
                 idx += self.batch_size
-                req = EmbedRequest(texts=batch)
+                req = EmbedRequest(texts=batch, packed=self.packed)
                 # Fire and forget: schedule the request, log on completion
                 async def send_and_log(req, batch, batch_embeddings):
                     try:
                         resp = await stub.Embed(req, timeout=self.timeout)
-                        if hasattr(resp, 'embeddings') and len(resp.embeddings) == len(batch_embeddings):
-                            mismatches = [i for i, emb_msg in enumerate(resp.embeddings)
-                                          if not embeddings_match(batch_embeddings[i], list(emb_msg.vector))]
+                        embeddings = decode_embeddings(resp)
+                        if len(embeddings) == len(batch_embeddings):
+                            mismatches = [i for i, emb in enumerate(embeddings)
+                                          if not embeddings_match(batch_embeddings[i], emb)]
                             if mismatches:
                                 for i in mismatches:
-                                    logging.error(f"Embedding mismatch for text: {batch[i]}\nExpected: {batch_embeddings[i][:5]}...\nReturned: {list(resp.embeddings[i].vector)[:5]}...\nResponse code: {resp.code} | Return msg: {resp.return_msg}")
+                                    logging.error(f"Embedding mismatch for text: {batch[i]}\nExpected: {batch_embeddings[i][:5]}...\nReturned: {list(embeddings[i])[:5]}...\nResponse code: {resp.code} | Return msg: {resp.return_msg}")
                             # No else: don't increment success_count, just log errors
                         else:
                             logging.error(f"Response does not match request! Sent: {batch} | Response code: {resp.code} | Return msg: {resp.return_msg}")
@@ -0,0 +1,68 @@
+'''
+Compare the INT8 model variant against fp32: throughput on this machine and embedding drift.
+Run from the worker app directory, after producing the INT8 model with quantize.py.
+'''
+import argparse
+import json
+import time
+
+import numpy as np
+
+from main import MODEL_PATHS, create_session, embed
+
+
+def embed_corpus(model_session, texts, batch_size):
+    return np.concatenate([embed(texts[i:i + batch_size], model_session) for i in range(0, len(texts), batch_size)])
+
+
+def throughput(model_session, texts, batch_size, rounds):
+    embed_corpus(model_session, texts, batch_size)  # Warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        embed_corpus(model_session, texts, batch_size)
+    return rounds * len(texts) / (time.perf_counter() - start)
+
+
+def cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main(args):
+    with open(args.validation_data_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    texts = [r["text"] for r in records]
+    reference = np.array([r["embedding"] for r in records], dtype=np.float32)
+
+    fp32 = create_session(args.fp32_model, args.threads)
+    int8 = create_session(args.int8_model, args.threads)
+    fp32_embeddings = embed_corpus(fp32, texts, args.batch_size)
+    int8_embeddings = embed_corpus(int8, texts, args.batch_size)
+
+    drift = cosine(fp32_embeddings, int8_embeddings)
+    print(f"Texts: {len(texts)}, batch size: {args.batch_size}")
+    print(f"fp32 vs validation data: min cosine {cosine(fp32_embeddings, reference).min():.6f}")
+    print(f"int8 vs fp32: mean cosine {drift.mean():.6f}, min {drift.min():.6f}, p1 {np.percentile(drift, 1):.6f}")
+
+    # Retrieval agreement: does every text still find the same nearest neighbour in the corpus
+    fp32_sim = fp32_embeddings @ fp32_embeddings.T
+    int8_sim = int8_embeddings @ int8_embeddings.T
+    np.fill_diagonal(fp32_sim, -np.inf)
+    np.fill_diagonal(int8_sim, -np.inf)
+    agreement = np.mean(fp32_sim.argmax(axis=1) == int8_sim.argmax(axis=1))
+    print(f"Nearest neighbour agreement: {agreement:.1%}")
+
+    fp32_rate = throughput(fp32, texts, args.batch_size, args.rounds)
+    int8_rate = throughput(int8, texts, args.batch_size, args.rounds)
+    print(f"fp32: {fp32_rate:.1f} texts/sec, int8: {int8_rate:.1f} texts/sec, speedup {int8_rate / fp32_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare throughput and embedding drift of the INT8 model against fp32.")
+    parser.add_argument('--validation-data-path', type=str, default="../../test/validation_data.jsonl", help='Path to validation data (default: ../../test/validation_data.jsonl)')
+    parser.add_argument('--fp32-model', type=str, default=MODEL_PATHS["fp32"], help=f'fp32 model (default: {MODEL_PATHS["fp32"]})')
+    parser.add_argument('--int8-model', type=str, default=MODEL_PATHS["int8"], help=f'INT8 model (default: {MODEL_PATHS["int8"]})')
+    parser.add_argument('--batch-size', type=int, default=32, help='Texts per model run (default: 32)')
+    parser.add_argument('--rounds', type=int, default=10, help='Passes over the corpus for the throughput measurement (default: 10)')
+    parser.add_argument('--threads', type=int, default=0, help='ONNX intra-op threads, 0 uses all cores (default: 0)')
+    args = parser.parse_args()
+    main(args)
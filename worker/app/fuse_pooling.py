@@ -0,0 +1,65 @@
+'''
+Produce model variants with mean pooling and L2 normalization built into the graph, served with
+WORKER_FUSED_POOLING=1. The session then outputs the final sentence embeddings, instead of the
+token embeddings that are pooled and normalized in NumPy. Check the result with test/test_fused_pooling.py.
+'''
+import argparse
+import os
+
+import onnx
+from onnx import TensorProto, helper
+
+from main import MODEL_PATHS, fused_model_path
+
+FUSED_OUTPUT = "sentence_embedding"
+
+
+def opset_version(model):
+    return next(opset.version for opset in model.opset_import if opset.domain in ("", "ai.onnx"))
+
+
+def fuse_pooling(input_path, output_path):
+    model = onnx.load(input_path)
+    graph = model.graph
+    token_embeddings = graph.output[0].name
+    dim = graph.output[0].type.tensor_type.shape.dim[2]
+    # Since opset 13 Unsqueeze and ReduceSum take their axes as an input instead of an attribute
+    axes_as_input = opset_version(model) >= 13
+    if axes_as_input:
+        graph.initializer.extend([
+            helper.make_tensor("pooling_axis_1", TensorProto.INT64, [1], [1]),
+            helper.make_tensor("pooling_axis_2", TensorProto.INT64, [1], [2]),
+        ])
+
+    def axes_node(op, inputs, output, axis, **kwargs):
+        if axes_as_input:
+            return helper.make_node(op, inputs + [f"pooling_axis_{axis}"], [output], **kwargs)
+        return helper.make_node(op, inputs, [output], axes=[axis], **kwargs)
+
+    graph.node.extend([
+        helper.make_node("Cast", ["attention_mask"], ["pooling_mask"], to=TensorProto.FLOAT),
+        axes_node("Unsqueeze", ["pooling_mask"], "pooling_mask_expanded", 2),
+        helper.make_node("Mul", [token_embeddings, "pooling_mask_expanded"], ["pooling_masked"]),
+        axes_node("ReduceSum", ["pooling_masked"], "pooling_sum", 1, keepdims=0),
+        axes_node("ReduceSum", ["pooling_mask_expanded"], "pooling_count", 1, keepdims=0),
+        helper.make_node("Div", ["pooling_sum", "pooling_count"], ["pooling_mean"]),
+        helper.make_node("LpNormalization", ["pooling_mean"], [FUSED_OUTPUT], axis=1, p=2),
+    ])
+    # Only the sentence embeddings leave the session, the token embeddings are never copied out
+    del graph.output[:]
+    output = helper.make_tensor_value_info(FUSED_OUTPUT, TensorProto.FLOAT, ["batch_size", dim.dim_value or dim.dim_param])
+    graph.output.append(output)
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build mean pooling and L2 normalization into the worker models.")
+    parser.add_argument('--input', type=str, help='Model to fuse (default: every model variant that exists)')
+    parser.add_argument('--output', type=str, help='Fused model (default: the input path with .pooled.onnx)')
+    args = parser.parse_args()
+    inputs = [args.input] if args.input else [path for path in MODEL_PATHS.values() if os.path.exists(path)]
+    for input_path in inputs:
+        output_path = args.output or fused_model_path(input_path)
+        fuse_pooling(input_path, output_path)
+        print(f"Wrote fused model to {output_path}")
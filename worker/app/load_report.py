@@ -0,0 +1,91 @@
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from proto.private_pb2 import StatusCode
+
+
+def cpu_usage_seconds():
+    '''
+    CPU time used by the container (cgroup v2 or v1), including executor processes.
+    Falls back to the CPU time of this process and its finished children.
+    '''
+    try:
+        with open("/sys/fs/cgroup/cpu.stat") as f:
+            for line in f:
+                key, value = line.split()
+                if key == "usage_usec":
+                    return int(value) / 1e6
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpuacct/cpuacct.usage") as f:
+            return int(f.read()) / 1e9
+    except (OSError, ValueError):
+        pass
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class LoadMonitor:
+    '''
+    Tracks the load of the worker for the status reports: Infer requests in progress, latency of the
+    requests of the last window seconds and CPU utilization of the last cpu_period seconds.
+    '''
+
+    def __init__(self, cpus, window=5, max_samples=5000, cpu_period=1.0):
+        self.cpus = cpus
+        self.window = window
+        self.cpu_period = cpu_period
+        self.inflight = 0
+        self._latencies = deque(maxlen=max_samples)  # (finished, latency in ms)
+        self._cpu_sample = (time.monotonic(), cpu_usage_seconds())
+        self._cpu_utilization = 0.0
+
+    def start(self):
+        self.inflight += 1
+
+    def finish(self, latency):
+        self.inflight -= 1
+        self._latencies.append((time.monotonic(), latency))
+
+    def latency_percentiles(self):
+        '''
+        p50 and p99 of the recent request latencies in ms, 0 if there were no requests.
+        '''
+        expired = time.monotonic() - self.window
+        while self._latencies and self._latencies[0][0] < expired:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0, 0.0
+        p50, p99 = np.percentile([latency for _, latency in self._latencies], [50, 99])
+        return float(p50), float(p99)
+
+    def cpu_utilization(self):
+        '''
+        Fraction of the available CPUs used, measured over at least cpu_period seconds, so frequent
+        callers (several coordinators watching the status) see the same figure.
+        '''
+        now = time.monotonic()
+        last_time, last_usage = self._cpu_sample
+        if now - last_time >= self.cpu_period:
+            usage = cpu_usage_seconds()
+            self._cpu_sample = (now, usage)
+            self._cpu_utilization = min(1.0, (usage - last_usage) / ((now - last_time) * self.cpus))
+        return self._cpu_utilization
+
+
+def worker_status(queue_depth, p99, cpu, max_queue_depth, max_p99, max_cpu, degraded=False, recovery=0.8):
+    '''
+    DEGRADED once any load figure crosses its threshold, a threshold of 0 is not checked. A degraded
+    worker only recovers once all figures are below recovery times their thresholds, so a load that
+    hovers around a threshold does not flip the status with every report.
+    '''
+    factor = recovery if degraded else 1.0
+    if ((max_queue_depth and queue_depth > factor * max_queue_depth)
+            or (max_p99 and p99 > factor * max_p99)
+            or (max_cpu and cpu > factor * max_cpu)):
+        return StatusCode.STATUS_DEGRADED
+    return StatusCode.STATUS_OK
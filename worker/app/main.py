@@ -1,24 +1,172 @@
 import asyncio
+import hashlib
 import logging
+import math
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import custom_logging
 import grpc
+from load_report import LoadMonitor, worker_status
+from micro_batching import MicroBatcher
 import numpy as np
 import onnxruntime as ort
 from prometheus_client import start_http_server
 from proto.private_pb2 import (HeartbeatRequest, HeartbeatResponse,
-                               InferRequest, InferResponse, StatusCode)
+                               InferRequest, InferResponse, StatusCode, WatchStatusRequest)
 from proto.private_pb2_grpc import WorkerServicer, add_WorkerServicer_to_server
-from proto.public_pb2 import Embedding, ReturnCode
+from proto.public_pb2 import Embedding, PackedEmbeddings, ReturnCode
 from transformers import AutoTokenizer
 
-MODEL_PATH = "model/all-MiniLM-L6-v2.onnx"
+# "fp32" serves the exported model, "int8" its dynamically quantized variant (see quantize.py)
+MODEL_VARIANT = os.environ.get("WORKER_MODEL_VARIANT", "fp32")
+MODEL_PATHS = {
+    "fp32": "model/all-MiniLM-L6-v2.onnx",
+    "int8": "model/all-MiniLM-L6-v2.int8.onnx",
+}
+# Serve the variant with mean pooling and normalization built into the graph (see fuse_pooling.py)
+FUSED_POOLING = os.environ.get("WORKER_FUSED_POOLING", "0") == "1"
+
+
+def fused_model_path(path):
+    return path.removesuffix(".onnx") + ".pooled.onnx"
+
+
+MODEL_PATH = fused_model_path(MODEL_PATHS[MODEL_VARIANT]) if FUSED_POOLING else MODEL_PATHS[MODEL_VARIANT]
 TOKENIZER_PATH = "model/tokenizer"
+# Reported to the coordinator, which keys its embedding cache by it.
+# Defaults to a digest of the model file.
+MODEL_ID = os.environ.get("WORKER_MODEL_ID", "")
+# Max padded tokens per batch this worker accepts, 0 leaves it to the coordinator
+MAX_BATCH_TOKENS = int(os.environ.get("WORKER_MAX_BATCH_TOKENS", "0"))
+def available_cpus():
+    '''
+    CPUs this worker may use: the affinity mask, further limited by the cgroup CPU quota of the
+    container, so replicas sharing a host do not each size their thread pools for the whole host.
+    '''
+    cpus = len(os.sched_getaffinity(0))
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            limit, period = f.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+# Where the compute path runs: "inline" (on the event loop), "thread" or "process" pool
+EXECUTOR_MODE = os.environ.get("WORKER_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("WORKER_EXECUTOR_WORKERS", "0")) or available_cpus()
+# ONNX Runtime session options. 0 intra-op threads splits the available CPUs between the executor workers.
+INTRA_OP_THREADS = int(os.environ.get("WORKER_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("WORKER_INTER_OP_THREADS", "1"))
+EXECUTION_MODE = os.environ.get("WORKER_EXECUTION_MODE", "sequential")  # "sequential" or "parallel"
+GRAPH_OPTIMIZATION = os.environ.get("WORKER_GRAPH_OPTIMIZATION", "all")  # "disable", "basic", "extended" or "all"
+MEM_PATTERN = os.environ.get("WORKER_MEM_PATTERN", "1") == "1"
+# Optimized graphs are saved here on first load and reused on later startups, "" disables the cache
+OPTIMIZED_MODEL_DIR = os.environ.get("WORKER_OPTIMIZED_MODEL_DIR", "model/optimized")
+# Merge concurrent Infer requests into larger model runs, see MicroBatcher
+MICRO_BATCHING = os.environ.get("WORKER_MICRO_BATCHING", "1") == "1"
+MICRO_BATCH_WAIT = float(os.environ.get("WORKER_MICRO_BATCH_WAIT", "0.002"))  # seconds
+MICRO_BATCH_TOKENS = int(os.environ.get("WORKER_MICRO_BATCH_TOKENS", "16384"))  # Padded tokens per model run
+MICRO_BATCH_TEXTS = int(os.environ.get("WORKER_MICRO_BATCH_TEXTS", "512"))
+# Batches processed concurrently per InferStream before reading from the stream pauses
+STREAM_MAX_INFLIGHT = int(os.environ.get("WORKER_STREAM_MAX_INFLIGHT", "0")) or 2 * EXECUTOR_WORKERS
+# The worker reports itself DEGRADED when a load figure exceeds its threshold, 0 disables the latency and CPU checks.
+# The stream caps the queue at about STREAM_MAX_INFLIGHT minus the running batches, plus the paused reads.
+DEGRADED_QUEUE_DEPTH = int(os.environ.get("WORKER_DEGRADED_QUEUE_DEPTH", "0")) or max(1, STREAM_MAX_INFLIGHT // 2)
+DEGRADED_P99_MS = float(os.environ.get("WORKER_DEGRADED_P99_MS", "1500"))
+DEGRADED_CPU = float(os.environ.get("WORKER_DEGRADED_CPU", "0"))
+DEGRADED_RECOVERY = 0.8  # A degraded worker recovers once all load figures are below this fraction of their thresholds
+STATUS_WINDOW = 5  # seconds of request latencies behind the reported p50/p99, kept short so a past burst does not linger
+STATUS_SAMPLE_INTERVAL = 0.25  # seconds between load samples on WatchStatus, changes are pushed at this rate
+STATUS_MAX_INTERVAL = 5  # seconds, WatchStatus pushes the status at least this often
+
+# Allow the coordinator's keepalive pings on its pooled long-lived channels
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_ping_interval_without_data_ms", 5000),
+    ("grpc.http2.max_ping_strikes", 0),
+]
+
+# The fast tokenizer mutates its padding/truncation state on every call, so each executor thread
+# gets its own instance. The ONNX session is safe to share between threads.
+_local = threading.local()
+session = None
+
 
-tokenizer = AutoTokenizer.from_pretrained(
-    TOKENIZER_PATH, local_files_only=True)
-session = ort.InferenceSession(MODEL_PATH, providers=["CPUExecutionProvider"])
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def create_session(path, intra_op_threads=0):
+    '''
+    Create an inference session with the configured options.
+    The optimized graph is cached in OPTIMIZED_MODEL_DIR, keyed by model digest, optimization level
+    and ONNX Runtime version. A cached graph is loaded without optimizing it again.
+    '''
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = INTER_OP_THREADS
+    options.execution_mode = EXECUTION_MODES[EXECUTION_MODE]
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[GRAPH_OPTIMIZATION]
+    options.enable_mem_pattern = MEM_PATTERN
+    if not OPTIMIZED_MODEL_DIR or GRAPH_OPTIMIZATION == "disable":
+        return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+    digest = model_identity(path).rsplit(":", 1)[1]
+    cached_path = os.path.join(OPTIMIZED_MODEL_DIR, f"{digest}-{GRAPH_OPTIMIZATION}-ort{ort.__version__}.onnx")
+    if os.path.exists(cached_path):
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        logging.info(f"Loading optimized graph from {cached_path}")
+        return ort.InferenceSession(cached_path, sess_options=options, providers=["CPUExecutionProvider"])
+    # Write to a private file first, so concurrently starting processes never load a partial graph
+    os.makedirs(OPTIMIZED_MODEL_DIR, exist_ok=True)
+    tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+    options.optimized_model_filepath = tmp_path
+    model_session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+    try:
+        os.replace(tmp_path, cached_path)
+        logging.info(f"Saved optimized graph to {cached_path}")
+    except OSError:
+        logging.warning(f"Could not save optimized graph to {cached_path}", exc_info=True)
+    return model_session
+
+
+def load_session(intra_op_threads=0):
+    global session
+    session = create_session(MODEL_PATH, intra_op_threads)
+
+
+def get_tokenizer():
+    tokenizer = getattr(_local, "tokenizer", None)
+    if tokenizer is None:
+        tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_PATH, local_files_only=True)
+        _local.tokenizer = tokenizer
+    return tokenizer
 
 
 def mean_pooling(token_embeddings, attention_mask):
@@ -30,43 +178,170 @@ def normalize(embeddings):
     return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
 
 
+def embed(texts, model_session=None):
+    '''
+    Tokenize texts, run the model and return the normalized sentence embeddings.
+    This is the compute path that is run in the executor, off the event loop.
+    Runs the worker's session unless another one is given. Sessions of fused models already output
+    the pooled and normalized sentence embeddings.
+    '''
+    tokenized = get_tokenizer()(texts, padding=True, truncation=True, return_tensors="np")
+    ort_inputs = {
+        "input_ids": tokenized["input_ids"],
+        "attention_mask": tokenized["attention_mask"],
+        "token_type_ids": tokenized["token_type_ids"]
+    }
+    outputs = (model_session or session).run(None, ort_inputs)[0]
+    if outputs.ndim == 2:
+        return outputs
+    pooled = mean_pooling(outputs, tokenized["attention_mask"])
+    return normalize(pooled)
+
+
+def pack_embeddings(embeddings):
+    '''
+    Serialize the embedding matrix as one little-endian float32 buffer, without per-float objects.
+    '''
+    return PackedEmbeddings(
+        data=np.ascontiguousarray(embeddings, dtype="<f4").tobytes(),
+        shape=embeddings.shape)
+
+
+def model_identity(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}:{digest.hexdigest()[:12]}"
+
+
+def create_executor(mode, workers):
+    '''
+    Create the executor for the compute path and load the model where it will run.
+    In process mode every process loads its own session, so the intra-op threads are split
+    between the processes. In thread mode the threads share one session.
+    '''
+    intra_op_threads = INTRA_OP_THREADS or max(1, available_cpus() // workers)
+    if mode == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=load_session,
+            initargs=(intra_op_threads,))
+    if mode == "thread":
+        load_session(intra_op_threads)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="infer")
+    if mode == "inline":
+        load_session(INTRA_OP_THREADS or available_cpus())
+        return None
+    raise ValueError(f"Unknown executor mode: {mode}")
+
+
 class WorkerServicerImpl(WorkerServicer):
-    def __init__(self):
+    def __init__(self, executor=None, model_id="", micro_batching=False):
         super().__init__()
         self.worker_id = os.environ.get("HOSTNAME", os.uname().nodename)
+        self.executor = executor
+        self.model_id = model_id
+        self.capacity = EXECUTOR_WORKERS if executor is not None else 1
+        self.load = LoadMonitor(available_cpus(), window=STATUS_WINDOW)
+        self.status = StatusCode.STATUS_OK
+        self.paused_reads = 0  # InferStreams that stopped reading until a batch completes
+        self.batcher = None
+        if micro_batching:
+            self.batcher = MicroBatcher(
+                self.run_embed, self.capacity, MICRO_BATCH_TEXTS, MICRO_BATCH_TOKENS, MICRO_BATCH_WAIT)
+
+    async def run_embed(self, texts):
+        if self.executor is None:
+            return embed(texts)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, embed, texts)
 
     async def Infer(self, request, context):
+        response, status = await self.infer(request)
+        if status is not None:
+            context.set_code(status)
+            context.set_details(response.return_msg)
+        return response
+
+    async def InferStream(self, request_iterator, context):
+        '''
+        Process batches from a long-lived stream concurrently and stream each result back as soon as it
+        is complete, tagged with the batch id of its request. Reading pauses while STREAM_MAX_INFLIGHT
+        batches are being processed, so HTTP/2 flow control pushes back on the coordinator.
+        '''
+        responses = asyncio.Queue()
+        slots = asyncio.Semaphore(STREAM_MAX_INFLIGHT)
+        tasks = set()
+
+        async def process(request):
+            try:
+                response, _ = await self.infer(request)
+                response.batch_id = request.batch_id
+                await responses.put(response)
+            finally:
+                slots.release()
+
+        async def read():
+            try:
+                async for request in request_iterator:
+                    # A read paused here holds a batch the coordinator sent, it counts towards the queue depth
+                    self.paused_reads += 1
+                    try:
+                        await slots.acquire()
+                    finally:
+                        self.paused_reads -= 1
+                    task = asyncio.create_task(process(request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+            finally:
+                await responses.put(None)
+
+        reader = asyncio.create_task(read())
+        try:
+            while (response := await responses.get()) is not None:
+                yield response
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    async def infer(self, request):
+        '''
+        Compute the embeddings for an InferRequest.
+        Returns the response and the gRPC status code to fail a unary call with, or None on success.
+        '''
         texts = list(request.input_data)
         logging.info(f"Received Infer request: {len(texts)} texts")
 
         if not texts or not all(isinstance(t, str) for t in texts):
             logging.error(f"Invalid input detected: {texts}")
-            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-            context.set_details("All input_data elements must be strings.")
             return InferResponse(
                 worker_id=self.worker_id,
-                code=ReturnCode.INPUT_ERROR,
+                code=ReturnCode.ERROR,
                 return_msg="Invalid input: input_data must be a list of strings.",
                 ids=[],
                 embeddings=[]
-            )
+            ), grpc.StatusCode.INVALID_ARGUMENT
 
+        start_time = time.monotonic()
+        self.load.start()
         try:
-            tokenized = tokenizer(texts, padding=True,
-                                  truncation=True, return_tensors="np")
-            ort_inputs = {
-                "input_ids": tokenized["input_ids"],
-                "attention_mask": tokenized["attention_mask"],
-                "token_type_ids": tokenized["token_type_ids"]
-            }
-            outputs = session.run(None, ort_inputs)[0]
-            pooled = mean_pooling(outputs, tokenized["attention_mask"])
-            embeddings = normalize(pooled)
-
-            embedding_messages = [
-                Embedding(vector=emb.tolist())
-                for emb in embeddings
-            ]
+            if self.batcher is not None:
+                embeddings = await self.batcher.submit(texts)
+            else:
+                embeddings = await self.run_embed(texts)
+
+            if request.packed:
+                embedding_messages = []
+                packed_embeddings = pack_embeddings(embeddings)
+            else:
+                embedding_messages = [
+                    Embedding(vector=emb.tolist())
+                    for emb in embeddings
+                ]
+                packed_embeddings = None
 
             logging.info(f"Successfully processed Infer request: {len(texts)} texts.")
             return InferResponse(
@@ -74,32 +349,101 @@ class WorkerServicerImpl(WorkerServicer):
                 code=ReturnCode.OK,
                 return_msg="",
                 ids=request.ids,
-                embeddings=embedding_messages
-            )
+                embeddings=embedding_messages,
+                packed_embeddings=packed_embeddings,
+                model_id=self.model_id
+            ), None
         except Exception as e:
             logging.exception("Error during inference")
-            context.set_code(grpc.StatusCode.INTERNAL)
-            context.set_details(str(e))
             return InferResponse(
                 worker_id=self.worker_id,
-                code=ReturnCode.SERVICE_ERROR,
+                code=ReturnCode.ERROR,
                 return_msg=str(e),
                 ids=[],
                 embeddings=[]
-            )
+            ), grpc.StatusCode.INTERNAL
+        finally:
+            self.load.finish((time.monotonic() - start_time) * 1000)
 
     async def Heartbeat(self, request, context):
-        return HeartbeatResponse(status=StatusCode.STATUS_OK)
+        return self.status_report()
+
+    async def WatchStatus(self, request, context):
+        '''
+        Push the status report whenever the status or the load changes, sampled every STATUS_SAMPLE_INTERVAL
+        seconds, and at least every STATUS_MAX_INTERVAL seconds. The stream stays open until the
+        coordinator cancels it, a broken stream tells it the worker is gone.
+        '''
+        last_state, last_sent = None, 0.0
+        while True:
+            report = self.status_report()
+            state = (report.status, report.inflight_batches, report.queue_depth)
+            now = time.monotonic()
+            if state != last_state or now - last_sent >= STATUS_MAX_INTERVAL:
+                yield report
+                last_state, last_sent = state, now
+            await asyncio.sleep(STATUS_SAMPLE_INTERVAL)
+
+    def status_report(self):
+        '''
+        Health and live load. The worker is DEGRADED while its queue, latency of the last STATUS_WINDOW
+        seconds or CPU utilization exceed the configured thresholds, see worker_status.
+        '''
+        if self.batcher is not None:
+            queue_depth = self.batcher.queue_depth + self.paused_reads
+        else:
+            queue_depth = max(0, self.load.inflight - self.capacity) + self.paused_reads
+        p50, p99 = self.load.latency_percentiles()
+        cpu = self.load.cpu_utilization()
+        status = worker_status(queue_depth, p99, cpu, DEGRADED_QUEUE_DEPTH, DEGRADED_P99_MS, DEGRADED_CPU,
+                               degraded=self.status == StatusCode.STATUS_DEGRADED, recovery=DEGRADED_RECOVERY)
+        if status != self.status:
+            if status != StatusCode.STATUS_OK:
+                logging.warning(f"Worker degraded: queue_depth={queue_depth} p99={p99:.1f}ms cpu={cpu:.2f}")
+            else:
+                logging.info("Worker recovered from degraded status.")
+            self.status = status
+        return HeartbeatResponse(
+            status=status,
+            model_id=self.model_id,
+            max_batch_tokens=MAX_BATCH_TOKENS,
+            inflight_batches=self.load.inflight,
+            queue_depth=queue_depth,
+            latency_p50_ms=p50,
+            latency_p99_ms=p99,
+            cpu_utilization=cpu,
+            capacity=self.capacity)
+
+
+async def warmup(executor, workers):
+    '''
+    Run one small batch per executor worker, so processes are spawned and models are loaded
+    before the first request arrives.
+    '''
+    if executor is None:
+        embed(["warmup"])
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(executor, embed, ["warmup"]) for _ in range(workers)))
 
 
 async def serve():
     start_http_server(8000)  # Expose metrics on port 8000
-    server = grpc.aio.server()
-    add_WorkerServicer_to_server(WorkerServicerImpl(), server)
+    executor = create_executor(EXECUTOR_MODE, EXECUTOR_WORKERS)
+    await warmup(executor, EXECUTOR_WORKERS)
+    logging.info(f"Inference executor ready: mode={EXECUTOR_MODE} workers={EXECUTOR_WORKERS}")
+    model_id = MODEL_ID or model_identity(MODEL_PATH)
+    logging.info(f"Serving model {model_id}")
+    server = grpc.aio.server(options=SERVER_OPTIONS)
+    add_WorkerServicer_to_server(WorkerServicerImpl(executor, model_id, MICRO_BATCHING), server)
     server.add_insecure_port("0.0.0.0:50051")
     await server.start()
     logging.info("Async Worker gRPC server started on port 50051")
-    await server.wait_for_termination()
+    try:
+        await server.wait_for_termination()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
 if __name__ == "__main__":
     # Prometheus server is already started above
@@ -0,0 +1,150 @@
+import asyncio
+
+from prometheus_client import Counter, Histogram
+
+MAX_SEQUENCE_LENGTH = 512  # Truncation length of the tokenizer
+# Merged runs are padded to their longest text, requests are only merged if that adds at most this
+# fraction of padding compared to running them separately
+MAX_PADDING_OVERHEAD = 0.25
+
+model_batch_texts_histogram = Histogram('worker_model_batch_texts', 'Number of texts per model run',
+                                        buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+model_batch_requests_histogram = Histogram('worker_model_batch_requests', 'Number of Infer requests merged into one model run',
+                                           buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+model_batch_rerun_count = Counter('worker_model_batch_rerun_count', 'Number of failed merged model runs rerun per request')
+
+
+def estimate_tokens(text):
+    '''
+    Cheap estimate of the tokenized length of a text, including the [CLS] and [SEP] tokens.
+    WordPiece averages roughly five characters of English text per token.
+    '''
+    return min(MAX_SEQUENCE_LENGTH, len(text) // 5 + 2)
+
+
+class PendingRequest:
+    def __init__(self, texts, future, queued):
+        self.texts = texts
+        self.future = future
+        self.queued = queued
+        self.max_tokens = max(estimate_tokens(text) for text in texts)
+
+
+class MicroBatcher:
+    '''
+    Merges concurrently arriving requests into larger model runs and splits the results back out.
+
+    At most concurrency model runs are in progress at a time. Requests arriving while all of them are
+    busy queue up, and are merged into the next run as soon as one finishes, as long as the merged run
+    stays within max_texts and the padded token budget (texts x longest text), and requests of very
+    different lengths are not merged. When a run slot is free, the oldest request waits at most
+    max_wait seconds for others to merge with. If a merged run fails, its requests are rerun one by
+    one, so a request the model rejects does not fail the requests it was merged with.
+    '''
+
+    def __init__(self, run_batch, concurrency, max_texts, max_tokens, max_wait):
+        self.run_batch = run_batch  # async callable: texts -> embedding matrix
+        self.max_texts = max_texts
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = []
+        self._arrived = asyncio.Event()
+        self._scheduler = None
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    async def submit(self, texts):
+        '''
+        Queue texts for the next model run and return their embeddings.
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(PendingRequest(texts, future, loop.time()))
+        self._arrived.set()
+        if self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule())
+        return await future
+
+    async def _schedule(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            await self._slots.acquire()
+            deadline = self._pending[0].queued + self.max_wait
+            while self._fits_more() and (remaining := deadline - loop.time()) > 0:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._take()
+            if batch:
+                asyncio.create_task(self._run(batch))
+            else:
+                self._slots.release()
+
+    def _fits_more(self):
+        texts = sum(len(request.texts) for request in self._pending)
+        max_tokens = max(request.max_tokens for request in self._pending)
+        return texts < self.max_texts and (texts + 1) * max_tokens < self.max_tokens
+
+    def _take(self):
+        '''
+        Remove the requests for the next run from the queue. The oldest request is always taken, even
+        if it exceeds the budget on its own, later ones in arrival order if they fit.
+        '''
+        self._pending = [request for request in self._pending if not request.future.done()]  # Callers that gave up
+        batch, remaining = [], []
+        texts, max_tokens, separate_tokens = 0, 0, 0
+        for request in self._pending:
+            merged_texts = texts + len(request.texts)
+            merged_tokens = max(max_tokens, request.max_tokens)
+            merged_separate = separate_tokens + len(request.texts) * request.max_tokens
+            if batch and (merged_texts > self.max_texts
+                          or merged_texts * merged_tokens > self.max_tokens
+                          or merged_texts * merged_tokens > merged_separate * (1 + MAX_PADDING_OVERHEAD)):
+                remaining.append(request)
+                continue
+            batch.append(request)
+            texts, max_tokens, separate_tokens = merged_texts, merged_tokens, merged_separate
+        self._pending = remaining
+        return batch
+
+    async def _run(self, batch):
+        try:
+            texts = [text for request in batch for text in request.texts]
+            model_batch_texts_histogram.observe(len(texts))
+            model_batch_requests_histogram.observe(len(batch))
+            embeddings = await self.run_batch(texts)
+            offset = 0
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+        except Exception as e:
+            if len(batch) > 1:
+                model_batch_rerun_count.inc()
+                await self._run_separately(batch)
+            else:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    async def _run_separately(self, batch):
+        for request in batch:
+            if request.future.done():
+                continue
+            try:
+                embeddings = await self.run_batch(request.texts)
+                if not request.future.done():
+                    request.future.set_result(embeddings)
+            except Exception as e:
+                if not request.future.done():
+                    request.future.set_exception(e)
@@ -39,11 +39,21 @@ class WorkerStub(object):
                 request_serializer=proto_dot_private__pb2.InferRequest.SerializeToString,
                 response_deserializer=proto_dot_private__pb2.InferResponse.FromString,
                 _registered_method=True)
+        self.InferStream = channel.stream_stream(
+                '/text_embedding.Worker/InferStream',
+                request_serializer=proto_dot_private__pb2.InferRequest.SerializeToString,
+                response_deserializer=proto_dot_private__pb2.InferResponse.FromString,
+                _registered_method=True)
         self.Heartbeat = channel.unary_unary(
                 '/text_embedding.Worker/Heartbeat',
                 request_serializer=proto_dot_private__pb2.HeartbeatRequest.SerializeToString,
                 response_deserializer=proto_dot_private__pb2.HeartbeatResponse.FromString,
                 _registered_method=True)
+        self.WatchStatus = channel.unary_stream(
+                '/text_embedding.Worker/WatchStatus',
+                request_serializer=proto_dot_private__pb2.WatchStatusRequest.SerializeToString,
+                response_deserializer=proto_dot_private__pb2.HeartbeatResponse.FromString,
+                _registered_method=True)
 
 
 class WorkerServicer(object):
@@ -55,12 +65,26 @@ class WorkerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def InferStream(self, request_iterator, context):
+        """Long-lived stream of batches. Responses are sent as batches complete, matched by batch_id.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def Heartbeat(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def WatchStatus(self, request, context):
+        """Pushes the status and load of the worker when they change, and at least every few seconds
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_WorkerServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -69,11 +93,21 @@ def add_WorkerServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_private__pb2.InferRequest.FromString,
                     response_serializer=proto_dot_private__pb2.InferResponse.SerializeToString,
             ),
+            'InferStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.InferStream,
+                    request_deserializer=proto_dot_private__pb2.InferRequest.FromString,
+                    response_serializer=proto_dot_private__pb2.InferResponse.SerializeToString,
+            ),
             'Heartbeat': grpc.unary_unary_rpc_method_handler(
                     servicer.Heartbeat,
                     request_deserializer=proto_dot_private__pb2.HeartbeatRequest.FromString,
                     response_serializer=proto_dot_private__pb2.HeartbeatResponse.SerializeToString,
             ),
+            'WatchStatus': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchStatus,
+                    request_deserializer=proto_dot_private__pb2.WatchStatusRequest.FromString,
+                    response_serializer=proto_dot_private__pb2.HeartbeatResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'text_embedding.Worker', rpc_method_handlers)
@@ -112,6 +146,33 @@ class Worker(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def InferStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/text_embedding.Worker/InferStream',
+            proto_dot_private__pb2.InferRequest.SerializeToString,
+            proto_dot_private__pb2.InferResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def Heartbeat(request,
             target,
@@ -138,3 +199,30 @@ class Worker(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def WatchStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/text_embedding.Worker/WatchStatus',
+            proto_dot_private__pb2.WatchStatusRequest.SerializeToString,
+            proto_dot_private__pb2.HeartbeatResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
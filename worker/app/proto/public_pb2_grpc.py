@@ -39,6 +39,11 @@ class TextEmbeddingStub(object):
                 request_serializer=proto_dot_public__pb2.EmbedRequest.SerializeToString,
                 response_deserializer=proto_dot_public__pb2.EmbedResponse.FromString,
                 _registered_method=True)
+        self.EmbedStream = channel.stream_stream(
+                '/text_embedding.TextEmbedding/EmbedStream',
+                request_serializer=proto_dot_public__pb2.EmbedRequest.SerializeToString,
+                response_deserializer=proto_dot_public__pb2.EmbedResponse.FromString,
+                _registered_method=True)
 
 
 class TextEmbeddingServicer(object):
@@ -50,6 +55,14 @@ class TextEmbeddingServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def EmbedStream(self, request_iterator, context):
+        """Bulk API: push requests continuously on one stream. Responses are sent as they complete, in any
+        order, matched by request_id. Backpressure is applied through gRPC flow control.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_TextEmbeddingServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +71,11 @@ def add_TextEmbeddingServicer_to_server(servicer, server):
                     request_deserializer=proto_dot_public__pb2.EmbedRequest.FromString,
                     response_serializer=proto_dot_public__pb2.EmbedResponse.SerializeToString,
             ),
+            'EmbedStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.EmbedStream,
+                    request_deserializer=proto_dot_public__pb2.EmbedRequest.FromString,
+                    response_serializer=proto_dot_public__pb2.EmbedResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'text_embedding.TextEmbedding', rpc_method_handlers)
@@ -95,3 +113,30 @@ class TextEmbedding(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def EmbedStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/text_embedding.TextEmbedding/EmbedStream',
+            proto_dot_public__pb2.EmbedRequest.SerializeToString,
+            proto_dot_public__pb2.EmbedResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
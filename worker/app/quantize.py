@@ -0,0 +1,31 @@
+'''
+Produce the dynamically quantized INT8 variant of the worker model, served with WORKER_MODEL_VARIANT=int8.
+
+The weights of the MatMul/Gemm layers are stored as INT8, activations are quantized on the fly per
+batch, so no calibration data is needed. Embedding lookups and layer norms stay in fp32, quantizing
+them costs a lot of accuracy for little speed. Check the result with compare_models.py.
+'''
+import argparse
+
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+from main import MODEL_PATHS
+
+
+def quantize(input_path, output_path, per_channel=False):
+    quantize_dynamic(
+        input_path,
+        output_path,
+        op_types_to_quantize=["MatMul", "Gemm"],
+        per_channel=per_channel,
+        weight_type=QuantType.QInt8)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantize the worker model to INT8 with dynamic quantization.")
+    parser.add_argument('--input', type=str, default=MODEL_PATHS["fp32"], help=f'fp32 model (default: {MODEL_PATHS["fp32"]})')
+    parser.add_argument('--output', type=str, default=MODEL_PATHS["int8"], help=f'Quantized model (default: {MODEL_PATHS["int8"]})')
+    parser.add_argument('--per-channel', action='store_true', help='Quantize weights per output channel, more accurate but slower on some CPUs (default: off)')
+    args = parser.parse_args()
+    quantize(args.input, args.output, args.per_channel)
+    print(f"Wrote quantized model to {args.output}")